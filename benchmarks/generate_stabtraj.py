@@ -0,0 +1,110 @@
+import argparse, math, random, string, sys
+from pathlib import Path
+import openpyxl
+from openpyxl.chart import ScatterChart, Reference, Series
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Stabtraj lengths are in mm with the nose at y=0 and the body going down to y=-length
+default_layout = {
+    "radius": 40,
+    "length": 1200,
+    "cone_length": 200,
+    "fin_span": 80,
+    "fin_chord": 150,
+    "fin_sweep": 40,
+    "canard_position": 400,
+}
+# Fin roots are sunk into the body so that the union gives a single outline
+fin_overlap = 12
+serie_spacing = 100
+first_row = 100
+
+def body_profile(layout, points, side):
+    radius, length, cone_length = layout["radius"], layout["length"], layout["cone_length"]
+    profile = [(0, -cone_length)]
+    for i in range(points):
+        y = -cone_length - (length - cone_length)*i/max(1, points - 1)
+        # Slight waviness with a boat tail, so that the text fit has a narrowest diameter to look for
+        x = radius - 8 if i >= points - max(1, points//12) else radius + 5*math.sin(i/3)
+        profile.append((side*round(x, 2), round(y, 2)))
+    return profile + [(0, -length)]
+
+# Points 0, -2 and -1 touch the body like on stabtraj fins, the outer edge having edge_points points
+def fin_polygon(root_x, root_top, root_bottom, span, sweep, edge_points, side):
+    tip_top, tip_bottom = root_top - sweep, root_bottom
+    outer = [(root_x + side*span, tip_top + (tip_bottom - tip_top)*i/max(1, edge_points - 1)) for i in range(edge_points)]
+    polygon = [(root_x, root_top)] + outer + [(root_x, root_bottom), (root_x, root_top)]
+    return [(round(x, 2), round(y, 2)) for x, y in polygon]
+
+def cone_profile(layout, points, side):
+    radius, cone_length = layout["radius"], layout["cone_length"]
+    return [(0, 0)] + [(side*round(radius*math.sin(i/points*math.pi/2), 2), round(-cone_length*i/points, 2)) for i in range(1, points + 1)]
+
+def stabtraj_series(body_points=60, fin_points=2, canard_points=2, cone_points=20, canards=True, **layout):
+    layout = {**default_layout, **layout}
+    radius, length = layout["radius"], layout["length"]
+    root_top, root_bottom = -length + layout["fin_chord"], -length + 20
+
+    series = {
+        "fuselage": body_profile(layout, body_points, 1),
+        "aileron": fin_polygon(radius - fin_overlap, root_top, root_bottom, layout["fin_span"] + fin_overlap, layout["fin_sweep"], fin_points, 1),
+        "fuselage2": body_profile(layout, body_points, -1),
+        "aileron2": fin_polygon(-radius + fin_overlap, root_top, root_bottom, layout["fin_span"] + fin_overlap, layout["fin_sweep"], fin_points, -1),
+    }
+    if canards:
+        canard_top = -layout["canard_position"]
+        series["canard"] = fin_polygon(radius - 10, canard_top, canard_top - 80, 40, 30, canard_points, 1)[:-1]
+        series["canard2"] = fin_polygon(-radius + 10, canard_top, canard_top - 80, 40, 30, canard_points, -1)[:-1]
+    series["Cone"] = cone_profile(layout, cone_points, 1)
+    series["Cone1"] = cone_profile(layout, cone_points, -1)
+    return series
+
+# Titled series are found by name, untitled ones by their position as in draw.usual_distribution
+def write_stabtraj(path, series, titles=True):
+    from draw import usual_distribution
+    book = openpyxl.Workbook()
+    sheet = book.active
+    sheet.title = "Stabilito"
+
+    if titles:
+        ordered = list(series.items())
+    else:
+        positions = {name: index for index, name in usual_distribution.items()}
+        ordered = [None]*(max(positions[name] for name in series) + 1)
+        for name, points in series.items():
+            ordered[positions[name]] = (name, points)
+
+    chart = ScatterChart()
+    row = first_row
+    for item in ordered:
+        name, points = item if item is not None else (None, [(0, 0), (0, 0)])
+        for i, (x, y) in enumerate(points):
+            sheet.cell(row=row + i, column=2, value=x)
+            sheet.cell(row=row + i, column=3, value=y)
+        x_values = Reference(sheet, min_col=2, min_row=row, max_row=row + len(points) - 1)
+        y_values = Reference(sheet, min_col=3, min_row=row, max_row=row + len(points) - 1)
+        chart.series.append(Series(y_values, x_values, title=name if titles else None))
+        row += max(serie_spacing, len(points) + 1)
+
+    sheet.add_chart(chart, "E5")
+    book.save(path)
+
+def synthetic_name(length, seed=0):
+    generator = random.Random(seed)
+    letters = string.ascii_uppercase + string.digits + "    -"
+    return "".join(generator.choice(letters) for _ in range(length)).strip() or "X"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic stabtraj workbook")
+    parser.add_argument("output")
+    parser.add_argument("--body-points", type=int, default=60)
+    parser.add_argument("--fin-points", type=int, default=2)
+    parser.add_argument("--canard-points", type=int, default=2)
+    parser.add_argument("--cone-points", type=int, default=20)
+    parser.add_argument("--no-canards", dest="canards", action="store_false")
+    parser.add_argument("--untitled", dest="titles", action="store_false")
+    args = parser.parse_args()
+
+    series = stabtraj_series(args.body_points, args.fin_points, args.canard_points, args.cone_points, args.canards)
+    write_stabtraj(args.output, series, args.titles)
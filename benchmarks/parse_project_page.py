@@ -0,0 +1,51 @@
+import sys, time, tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from project_page import parse_project_page
+
+fixtures = Path(__file__).resolve().parent/"fixtures"
+campaign = "C'Space"
+
+def parse_soup(html, campaign):
+    # Full tree lookups, as get_project_details did before project_page.py
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, features="lxml")
+    if soup.find("select", {"id": "project__campaign"}).find("option", {"selected": True}).text != campaign: return None
+    rce3_msg = soup.select(".border-rce3")
+    stabratjs = soup.find("h3", string="StabTraj's").parent.find_all("a")
+    last_stab = sorted(stabratjs, key=lambda x: int(x["href"].split("=")[-1]) if x["href"] != "#" else 0, reverse=True)[0]
+    return (soup.find("input", {"id": "project__name"})["value"], last_stab["href"],
+            last_stab.parent.parent.select_one(".project-document-filename").text, rce3_msg[-1].text if len(rce3_msg) > 0 else None)
+
+def measure(func, html, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(html, campaign)
+    elapsed = (time.perf_counter() - start)/repeat
+
+    # Python allocations only, libxml2 allocates the trees outside of tracemalloc
+    tracemalloc.start()
+    func(html, campaign)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main(repeat=200):
+    parsers = [("lxml xpath", parse_project_page)]
+    try:
+        import bs4
+        parsers.append(("beautifulsoup", parse_soup))
+    except ImportError:
+        pass
+
+    for fixture in sorted(fixtures.glob("project_page*.html")):
+        html = fixture.read_text(encoding="utf-8")
+        page = parse_project_page(html, campaign)
+        print(f"{fixture.name}: {page}")
+        for name, parser in parsers:
+            elapsed, peak = measure(parser, html, repeat)
+            print(f"  {name:<14} {elapsed*1000:8.3f} ms/page  {peak/1024:8.1f} KiB peak")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
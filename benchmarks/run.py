@@ -0,0 +1,164 @@
+import argparse, io, json, os, platform, statistics, sys, tempfile, time, tracemalloc
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(repo_dir))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import draw, merger, svg2pdf, workbook
+from generate_stabtraj import stabtraj_series, write_stabtraj, synthetic_name
+
+platter_dims = (601, 301)
+rocket_type = "minif"
+
+# Each stage is a function of the benchmark context, the stages after "workbooks" reuse the files of the previous ones
+def stage_workbooks(context):
+    for path in context["workbooks"]:
+        workbook.read_chart_series(path)
+
+def stage_build(context):
+    context["drawings"] = list()
+    for path, name in zip(context["workbooks"], context["names"]):
+        drawing = draw.StabDrawing(path, 2000, 6000, name, 2, font_path=context["font"], stroke_width=3, compact_paths=True, precision=3)
+        drawing.build()
+        context["drawings"].append(drawing)
+
+def stage_fit_text(context):
+    for drawing in context["drawings"]:
+        drawing.fit_text()
+
+def stage_draw_svg(context):
+    for drawing, path in zip(context["drawings"], context["rockets"]):
+        drawing.draw(path, metadata=True)
+
+def stage_draw_pdf(context):
+    for drawing in context["drawings"]:
+        drawing.draw(io.BytesIO(), backend="pdf")
+
+def stage_svg_bbox(context):
+    for path in context["rockets"]:
+        merger.svg_bbox(path)
+
+def stage_get_scale(context):
+    for path in context["rockets"]:
+        merger.get_scale(path, context["base"]["rectangle_size"])
+
+def stage_apply_svg(context):
+    for rocket, card in zip(context["rockets"], context["cards"]):
+        merger.apply_svg(context["base"], rocket, card)
+
+def stage_merge_platters(context):
+    merger.merge_platters(sorted(context["cards"]*context["copies"]), platter_dims, context["directory"]/"output_platters", prefix=rocket_type)
+
+def stage_bulk_convert(context):
+    svg2pdf.bulk_convert(str(context["directory"]/"output_rockets"/"*.svg"), context["directory"]/"output_rockets.pdf")
+
+def stage_end_to_end(context):
+    for stage in [stage_workbooks, stage_build, stage_draw_svg, stage_apply_svg, stage_merge_platters, stage_bulk_convert]:
+        stage(context)
+
+stages = {
+    "workbooks": stage_workbooks,
+    "build": stage_build,
+    "fit_text": stage_fit_text,
+    "draw_svg": stage_draw_svg,
+    "draw_pdf": stage_draw_pdf,
+    "svg_bbox": stage_svg_bbox,
+    "get_scale": stage_get_scale,
+    "apply_svg": stage_apply_svg,
+    "merge_platters": stage_merge_platters,
+    "bulk_convert": stage_bulk_convert,
+    "end_to_end": stage_end_to_end,
+}
+
+def prepare(directory, args):
+    for folder in ["cache", "output_rockets", "output_cards", "output_platters"]:
+        os.makedirs(directory/folder, exist_ok=True)
+    with open(repo_dir/"config_example.json", encoding="utf-8") as f:
+        base = json.load(f)["bases"][rocket_type]
+    base["path"] = str(repo_dir/base["path"])
+
+    context = {"directory": directory, "font": args.font, "base": base, "copies": args.copies, "workbooks": list(), "names": list(), "rockets": list(), "cards": list()}
+    for i in range(args.rockets):
+        # Rockets of increasing detail, like a campaign mixing hand made and exported stabtrajs
+        scale = 1 + i/max(1, args.rockets - 1)
+        series = stabtraj_series(int(args.body_points*scale), args.fin_points, args.canard_points, int(args.cone_points*scale), canards=i % 2 == 0)
+        path = directory/"cache"/f"{i}_stab.xlsx"
+        write_stabtraj(path, series)
+        context["workbooks"].append(path)
+        context["names"].append(synthetic_name(args.name_length, seed=i))
+        context["rockets"].append(str(directory/"output_rockets"/f"{i}_stab.svg"))
+        context["cards"].append(str(directory/"output_cards"/f"{i}_stab_{rocket_type}.svg"))
+    return context
+
+def measure(stage, context, repeat):
+    timings = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        stage(context)
+        timings.append(time.perf_counter() - start)
+
+    # Python allocations of this process only, pool workers and C libraries are not traced
+    tracemalloc.start()
+    stage(context)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": statistics.median(timings), "min_seconds": min(timings), "peak_kib": peak/1024}
+
+def compare(results, baseline, threshold):
+    regressions = list()
+    print(f"{'stage':<16}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, result in results.items():
+        if name not in baseline["stages"]: continue
+        previous = baseline["stages"][name]["seconds"]
+        ratio = result["seconds"]/previous if previous > 0 else float("inf")
+        flag = ""
+        if ratio > threshold:
+            regressions.append(name)
+            flag = "  regression"
+        print(f"{name:<16}{previous*1000:>10.1f}ms{result['seconds']*1000:>10.1f}ms{ratio:>8.2f}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Times and memory-profiles each stage on synthetic stabtrajs")
+    parser.add_argument("--rockets", type=int, default=8)
+    parser.add_argument("--copies", type=int, default=3)
+    parser.add_argument("--body-points", type=int, default=60)
+    parser.add_argument("--fin-points", type=int, default=2)
+    parser.add_argument("--canard-points", type=int, default=2)
+    parser.add_argument("--cone-points", type=int, default=20)
+    parser.add_argument("--name-length", type=int, default=16)
+    parser.add_argument("--font", default=str(repo_dir/"fonts"/"nasalization-rg.otf"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=list(stages), default=list(stages))
+    parser.add_argument("--save", help="Writes the results as a baseline JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        context = prepare(Path(directory), args)
+        # Stages reuse the drawings and files of the previous ones
+        stage_build(context)
+        stage_draw_svg(context)
+        stage_apply_svg(context)
+
+        results = dict()
+        for name in args.stages:
+            results[name] = measure(stages[name], context, args.repeat)
+            print(f"{name:<16}{results[name]['seconds']*1000:>10.1f}ms{results[name]['peak_kib']:>12.0f} KiB")
+
+    if args.save:
+        parameters = {key: value for key, value in vars(args).items() if key not in ["save", "compare", "threshold", "stages"]}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"parameters": parameters, "python": platform.python_version(), "machine": platform.machine(), "stages": results}, f, indent=4)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["parameters"] != {key: value for key, value in vars(args).items() if key in baseline["parameters"]}:
+            print("Paramètres différents de la référence, comparaison indicative")
+        if len(compare(results, baseline, args.threshold)) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
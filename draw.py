@@ -1,18 +1,25 @@
-import openpyxl
 import pyclipper
-import re
+import numpy as np
 from svg_text import Text
-from math import sqrt, pow
+from workbook import read_chart_series
+from geometry_cache import GeometryCache
+import geometry
+import tracing
+import hashlib, inspect, json, os
+from pathlib import Path
+import workbook
 
 import warnings
 warnings.simplefilter("ignore")
 import drawSvg as draw
+from reportlab.pdfgen import canvas
+from reportlab.lib import colors
 
-range_regex = re.compile(r"!\$(.)\$(\d{3}):\$(.)\$(\d{3})")
-
-letters = [letter for letter in "ABCDEFGHIJKLMNOPQRSTUVXYZ"]
 max_text_width = 0.75
 text_height_percentage = 0.75
+geometry_cache_dir = "cache/geometry"
+geometry_cache_max_bytes = 256*1024**2
+default_font_path = "fonts/nasalization-rg.otf"
 
 chart_series = [
     "aileron",
@@ -53,145 +60,183 @@ usual_distribution = {
 def post_process_fins(series_polys):
     for fins_serie in fins_series:
         if fins_serie not in series_polys: continue
-        sign = 1 if series_polys[fins_serie][2][0] > 0 else -1
-        for contact_index in fin_body_contacts:
-            if len(series_polys[fins_serie]) >= contact_index+1:
-                series_polys[fins_serie][contact_index][0] -= sign*0.1
+        series_polys[fins_serie] = geometry.offset_contacts(series_polys[fins_serie], fin_body_contacts, 0.1)
     return series_polys
 
 def post_process_motor(series_polys):
     for motor_serie in body_series:
-        serie = series_polys[motor_serie]
-        for i in range(1, len(serie)):
-            if serie[i][1] > serie[i-1][1]:
-                serie[i][1] = serie[i-1][1]
-            
+        series_polys[motor_serie] = geometry.clamp_monotonic(series_polys[motor_serie])
     return series_polys
 
 class StabDrawing():
     
-    def __init__(self, path, width, height, name, notch_width, font_path="fonts/nasalization-rg.otf", stroke_width=0.01):
-        self.post_process_funcs = [post_process_fins, post_process_motor, self.get_body_base_points]
+    def __init__(self, path, width, height, name, notch_width, font_path=default_font_path, stroke_width=0.01, geometry_cache=None, compact_paths=False, precision=None):
+        self.post_process_funcs = [post_process_fins, post_process_motor]
         self.font_path = font_path
-        book = openpyxl.load_workbook(path, data_only=True)
-        try:
-            self.sheet = book["Stabilito"]
-        except KeyError:
-            self.sheet = book["stabilito"]
         self.width, self.height = width, height
         self.stroke_width = stroke_width
         self.path = path
         self.name = name
         self.notch_width = notch_width
+        self.compact_paths = compact_paths
+        self.precision = precision
+        self.outline = None
+        self.backend = "svg"
+        self.cached_geometry = None
+        
+        self.geometry_cache = geometry_cache
+        if geometry_cache is not None:
+            self.cache_key = geometry_cache.key(path)
+            self.cached_geometry = geometry_cache.load(self.cache_key)
+            if self.cached_geometry is not None:
+                self.series = self.cached_geometry["series"]
+                return
+        
+        with tracing.span("workbook_load"):
+            workbook_series = read_chart_series(path)
         
         self.series = dict()
-        for i, serie in enumerate(self.sheet._charts[0].series):
-            serie_title = None
-            if serie.title is None:
-                if i in usual_distribution:
-                    serie_title = usual_distribution[i].lower()
-            elif serie.title.value in chart_series:
-                serie_title = serie.title.value.lower()
-            
-            if serie_title is not None:
-                x_points = self.range_reduce(serie.xVal.numRef.f)
-                y_points = self.range_reduce(serie.yVal.numRef.f)
-                self.series[serie_title] = list(zip(x_points, y_points))
+        with tracing.span("series_extraction"):
+            for i, (title, x_points, y_points) in enumerate(workbook_series):
+                serie_title = None
+                if title is None:
+                    if i in usual_distribution:
+                        serie_title = usual_distribution[i].lower()
+                elif title in chart_series:
+                    serie_title = title.lower()
+                
+                if serie_title is not None:
+                    self.series[serie_title] = np.column_stack((x_points, y_points))
                 
         if len(self.series) == 0:
             raise Exception("No series")
-                
-    def range_reduce(self, a1_range):
-        result = re.findall(range_regex, a1_range)[0]
-        x1, y1 = self.a1_to_xy(f"{result[0]}{result[1]}")
-        x2, y2 = self.a1_to_xy(f"{result[2]}{result[3]}")
-        points = [self.xy_to_a1(x, y) for x in range(x1, x2+1) for y in range(y1, y2+1)]
-        return list(points)
-    
-    def xy_to_a1(self, x, y):
-        return f"{letters[x]}{y}"
-    
-    def a1_to_xy(self, a1):
-        x = letters.index(a1[0])
-        y = int(a1[1:])
-        return x, y
-        
-    def get_points(self, points):
-        output = list()
-        for x, y in points:
-            output.append((self.sheet[x].value, self.sheet[y].value))
-            
-        return output
 
     def draw_lines(self, lines, color="red"):
+        if self.backend == "pdf":
+            self.d.setStrokeColor(colors.toColor(color))
+            self.d.setLineWidth(self.stroke_width)
+            path = self.d.beginPath()
+            for polyline in geometry.chain_segments(lines, self.precision):
+                path.moveTo(*polyline[0].tolist())
+                for point in polyline[1:].tolist():
+                    path.lineTo(*point)
+            self.d.drawPath(path, stroke=1, fill=0)
+            return
+        
+        if self.compact_paths:
+            for polyline in geometry.chain_segments(lines, self.precision):
+                self.d.append(draw.Lines(*polyline.ravel().tolist(), stroke=color, stroke_width=self.stroke_width, fill="none"))
+            return
+        
         for line in lines:
             self.d.append(draw.Line(*line[0], *line[1], stroke=color, stroke_width=self.stroke_width, fill="none"))
 
-    def draw(self, path):
-        self.d = draw.Drawing(self.width, self.height, origin=(-int(self.width/2), -self.height), displayInline=False)
-        self.series_polys = dict()
-        for serie_name, serie_points in self.series.items(): # TODO Ajouter dans post-process
-            points = self.get_points(serie_points)
-            if serie_name.lower() in ["cone", "cone1"]:
-                points.append((0, points[-1][1]))
-            self.series_polys[serie_name] = points
-        
-        self.series_polys = self.clean_series(self.series_polys)
-        
-        for post_process_func in self.post_process_funcs:
-            self.series_polys = post_process_func(self.series_polys)
-            self.series_polys = self.clean_series(self.series_polys)
+    def build(self):
+        if self.cached_geometry is not None:
+            self.series_polys = self.cached_geometry["series_polys"]
+            self.body_base_points = self.cached_geometry["body_base_points"]
+        else:
+            with tracing.span("post_processing"):
+                self.process_series()
+            if self.geometry_cache is not None:
+                self.geometry_cache.store(self.cache_key, self.series, self.series_polys, self.body_base_points)
                 
-        polygons = list(self.series_polys.values())
-        outlines = self.union(polygons)
+        with tracing.span("union"):
+            outlines = self.union(list(self.series_polys.values()))
         if len(outlines) != 1:
             raise Exception(f"Too much polygons after union")
-        outline = outlines[0]
+        self.outline = np.array(outlines[0])
         
-        lines = list()
-        for i in range(1, len(outline)-1):
-            if outline[i-1] in self.body_base_points and outline[i] in self.body_base_points: continue
-            
-            if outline[i-1][1] == outline[i][1] == self.body_base_points[0][1]:
-                
-                lines.append([outline[i-1], min((point for point in self.body_base_points), key=lambda x:self.distance(outline[i-1], x))])
-                lines.append([min((point for point in self.body_base_points), key=lambda x:self.distance(outline[i], x)), outline[i]])
-            else:
-                lines.append([outline[i-1], outline[i]])
-        lines.append([lines[-1][1], lines[0][0]])
-        self.draw_lines(lines)
+        with tracing.span("text_fit"):
+            self.text = self.fit_text()
+
+    def process_series(self):
+        series_polys = dict()
+        for serie_name, serie_points in self.series.items():
+            if serie_name.lower() in ["cone", "cone1"]:
+                serie_points = np.vstack((serie_points, [0, serie_points[-1][1]]))
+            series_polys[serie_name] = serie_points
         
-        self.draw_extras()
+        series_polys = geometry.clean_series(series_polys)
+        for post_process_func in self.post_process_funcs:
+            series_polys = post_process_func(series_polys)
+        series_polys = geometry.clean_series(series_polys)
         
-        self.d.saveSvg(path)
+        self.series_polys = {name: geometry.close_polygon(polygon) for name, polygon in series_polys.items()}
+        self.body_base_points = self.get_body_base_points(self.series_polys)
     
-    def clean_series(self, series):
-        clean_series = dict()
-        for poly_name, polygon in series.items():
-            clean_poly = self.clean_polygon(polygon)
-            if clean_poly is not None:
-                clean_series[poly_name] = clean_poly
-        return clean_series
+    def get_bbox(self):
+        if self.outline is None:
+            self.build()
+        xmin, xmax = min(0, float(self.outline[:, 0].min())), max(0, float(self.outline[:, 0].max()))
+        ymin, ymax = min(0, -float(self.outline[:, 1].max())), max(0, -float(self.outline[:, 1].min()))
+        
+        text_bbox = self.text.get_transformed_bbox()
+        xmin, xmax = min(xmin, text_bbox[0]), max(xmax, text_bbox[2])
+        ymin, ymax = min(ymin, -text_bbox[3]), max(ymax, -text_bbox[1])
+        return xmin, xmax, ymin, ymax
+
+    def draw(self, path, metadata=False, backend="svg"):
+        if self.outline is None:
+            self.build()
+        if backend == "pdf":
+            with tracing.span("pdf_write"):
+                self.draw_pdf(path)
+            return
+        
+        with tracing.span("svg_write"):
+            self.render_svg().saveSvg(path)
+        
+            metadata_path = Path(path).with_suffix(".json")
+            if metadata:
+                with open(metadata_path, "w", encoding="utf-8") as f:
+                    json.dump(self.get_metadata(), f)
+            else:
+                metadata_path.unlink(missing_ok=True)
     
-    def clean_polygon(self, points):
-        if len(points) == 0: return None 
-        origin = points[0]
-        if not any(point != origin for point in points): return None
-        polygon = [list(points[0])]
-        for i in range(1, len(points)):
-            if self.distance(points[i-1], points[i]) > 0:
-                polygon.append(list(points[i]))
-        return polygon            
+    # Returns the drawSvg drawing of the rocket, asSvg() giving the SVG data without writing a file
+    def render_svg(self):
+        if self.outline is None:
+            self.build()
+        self.backend = "svg"
+        self.d = draw.Drawing(self.width, self.height, origin=(-int(self.width/2), -self.height), displayInline=False)
+        self.draw_lines(geometry.outline_segments(self.outline, self.body_base_points).tolist())
+        
+        self.draw_extras()
+        return self.d
     
-    def distance(self, point1, point2):
-        return sqrt(pow(point1[0]-point2[0], 2) + pow(point1[1]-point2[1], 2))
+    # Draws the rocket as a new page of a reportlab canvas, or as a one page document if given a path or file
+    def draw_pdf(self, target):
+        page_canvas = target if isinstance(target, canvas.Canvas) else canvas.Canvas(target)
+        page_canvas.setPageSize((self.width, self.height))
+        page_canvas.saveState()
+        page_canvas.translate(int(self.width/2), self.height)
+        
+        self.backend = "pdf"
+        self.d = page_canvas
+        self.draw_lines(geometry.outline_segments(self.outline, self.body_base_points).tolist())
+        self.draw_extras()
+        
+        page_canvas.restoreState()
+        page_canvas.showPage()
+        if page_canvas is not target:
+            page_canvas.save()
+    
+    def get_metadata(self):
+        return {
+            "bbox": list(self.get_bbox()),
+            "width": self.width,
+            "height": self.height,
+            "stroke_width": self.stroke_width,
+            "notch_width": self.notch_width,
+            "body_base_points": self.body_base_points.tolist(),
+            "font_size": self.text.font_size,
+        }
     
     def union(self, polygons):
         pc = pyclipper.Pyclipper()
         for polygon in polygons:
-            if polygon[0] != polygon[-1]:
-                polygon.append(polygon[0])
-            pc.AddPath(polygon, pyclipper.PT_CLIP, True)
+            pc.AddPath(polygon.tolist(), pyclipper.PT_CLIP, True)
         output = pc.Execute(pyclipper.CT_UNION, pyclipper.PFT_NONZERO, pyclipper.PFT_NONZERO)
         output[0].append(output[0][0])
         return output
@@ -201,128 +246,193 @@ class StabDrawing():
         for fin_serie_name in fins_series:
             if fin_serie_name not in self.series_polys: continue
             fin_serie = self.series_polys[fin_serie_name]
-            self.draw_lines([[fin_serie[0], fin_serie[-2]]], color="lime")
+            self.draw_lines([[fin_serie[0].tolist(), fin_serie[-2].tolist()]], color="lime")
         
         # Project name
-        base = min(point[1] for point in self.series_polys["fuselage"])
-        top = max(point[1] for point in self.series_polys["fuselage"])
+        if self.backend == "pdf":
+            self.text.draw_pdf(self.d)
+        else:
+            self.text.draw(self.d)
+        
+        # Notch
+        base_height = self.body_base_points[0][1]
+        for point in self.body_base_points.tolist():
+            if point[0] < 0:
+                self.draw_lines([[point, [-self.notch_width/2, base_height]]])
+            else:
+                self.draw_lines([[point, [self.notch_width/2, base_height]]])
+        self.draw_lines([[[-self.notch_width/2, base_height], [self.notch_width/2, base_height]]], color="blue")
+        
+        
+    def fit_text(self):
+        fuselage = self.series_polys["fuselage"]
+        base, top = fuselage[:, 1].min(), fuselage[:, 1].max()
         text_y = -int((max(base, top) - min(base, top))/2-top)
         
-        min_diam = max(point[0] for point in self.series_polys["fuselage"])
+        max_diam = fuselage[:, 0].max()
         text_y_range = text_y - max_text_width*(top - base)/2, text_y + max_text_width*(top - base)/2
         text_y_size = text_y_range[1] - text_y_range[0]
 
-        points = [(abs(point[0]), point[1]) for point in self.series_polys["fuselage"]]
-        for point in points:
-            if point[0] < min_diam and text_y_range[0] < point[1] < text_y_range[1]:
-                min_diam = point[0]
+        diameters, heights = np.abs(fuselage[:, 0]), fuselage[:, 1]
+        in_range = (diameters < max_diam) & (text_y_range[0] < heights) & (heights < text_y_range[1])
+        min_diam = diameters[in_range].min() if in_range.any() else max_diam
         
-        if min_diam == max(point[0] for point in self.series_polys["fuselage"]):
-            min_diam, min_diam_y = 0, self.height
-            for point in points:
-                if point[1] < text_y and point[0] > min_diam and point[1] < min_diam_y:
-                    min_diam = point[0]
+        if min_diam == max_diam:
+            below = heights < text_y
+            min_diam = max(0, diameters[below].max()) if below.any() else 0
+        min_diam = float(min_diam)
         
         text = Text(self.name.upper(), min_diam*text_height_percentage, self.font_path, (0, text_y), rotate_angle=90, rotate_origin=(0, text_y))
+        text.fit_to_box(text_y_size, 2*min_diam*text_height_percentage)
         text_bbox = text.get_bbox()
         
-        font_size_modifier = min_diam*text_height_percentage
-        while text_bbox[2]-text_bbox[0] > text_y_size or text_bbox[3]-text_bbox[1] > 2*min_diam*text_height_percentage:
-            font_size_modifier -= 1
-            text.set_font_size(font_size_modifier)
-            text_bbox = text.get_bbox()
-        
         text.offset[0] -= int(text_bbox[2]/2)
         text.offset[1] -= int(text_bbox[3]/2)
         text.rotation_origin = text.offset
-        text.draw(self.d)
-        
-        # Notch
-        base_height = self.body_base_points[0][1]
-        for point in self.body_base_points:
-            if point[0] < 0:
-                self.draw_lines([[point, [-self.notch_width/2, base_height]]])
-            else:
-                self.draw_lines([[point, [self.notch_width/2, base_height]]])
-        self.draw_lines([[[-self.notch_width/2, base_height], [self.notch_width/2, base_height]]], color="blue")
-        
-        
+        return text
+    
     def get_body_base_points(self, series_polys):
-        self.body_base_points = list()
-        for body_serie in body_series:
-            base_point = 0, 0
-            for x, y in series_polys[body_serie]:
-                if abs(y) > abs(base_point[1]):
-                    base_point = x, y
-                elif abs(y) == abs(base_point[1]) and abs(x) > abs(base_point[0]):
-                    base_point = x, y
-
-            self.body_base_points.append(list(int(coord) for coord in base_point))
-        if len(self.body_base_points) != 2:
+        body_base_points = np.array([geometry.base_point(series_polys[body_serie]) for body_serie in body_series])
+        if len(body_base_points) != 2:
             raise Exception("Too many base points")
-        return series_polys
+        return body_base_points
 
-def draw_worker(file, project, base_config):
-    from merger import get_scale, mm_per_pix
+# Cached geometry is only valid for the code that produced it
+geometry_version = hashlib.sha256("".join([
+    inspect.getsource(workbook),
+    inspect.getsource(geometry),
+    inspect.getsource(post_process_fins),
+    inspect.getsource(post_process_motor),
+    inspect.getsource(StabDrawing.__init__),
+    inspect.getsource(StabDrawing.process_series),
+    inspect.getsource(StabDrawing.get_body_base_points),
+    repr((chart_series, fins_series, body_series, fin_body_contacts, usual_distribution)),
+]).encode()).hexdigest()[:16]
+
+# Returns (error, file, pdf page), the page being the rocket drawn directly as a one page PDF when pdf_page is set
+def draw_worker(file, project, base_config, single_pass=True, pdf_page=False):
+    from merger import get_scale, get_scale_from_bbox, mm_per_pix
     from pathlib import Path
+    import io
     
+    page = None
     try:
-        output_path = f"output_rockets/{Path(file).stem}.svg"
-        drawing = StabDrawing(Path(file), 2000, 6000, project["name"], 2, stroke_width=3)
-        drawing.draw(output_path)
-        scale = get_scale(output_path, base_config["rectangle_size"])
-        Path(output_path).unlink()
-        drawing.notch_width = mm_per_pix*base_config["notch_size"]/scale
-        drawing.draw(output_path)
+        with tracing.span("rocket", file=Path(file).name):
+            output_path = f"output_rockets/{Path(file).stem}.svg"
+            cache = GeometryCache(geometry_cache_dir, geometry_version, geometry_cache_max_bytes)
+            drawing = StabDrawing(Path(file), 2000, 6000, project["name"], 2, stroke_width=3, geometry_cache=cache, compact_paths=True, precision=3)
+            if single_pass:
+                bbox = drawing.get_bbox()
+                with tracing.span("scale"):
+                    scale = get_scale_from_bbox(bbox, base_config["rectangle_size"])
+            else:
+                drawing.draw(output_path)
+                with tracing.span("scale"):
+                    scale = get_scale(output_path, base_config["rectangle_size"])
+                Path(output_path).unlink()
+            drawing.notch_width = mm_per_pix*base_config["notch_size"]/scale
+            drawing.draw(output_path, metadata=True)
+            if pdf_page:
+                page = io.BytesIO()
+                drawing.draw(page, backend="pdf")
+                page = page.getvalue()
     except Exception as e:
-        return e, file
+        return e, file, None
     finally:
         pass
     
-    return None
+    return None, file, page
+
+def draw_batch(tasks, **kwargs):
+    return [draw_worker(file, project, base_config, **kwargs) for file, project, base_config in tasks]
+
+def worker_count(config):
+    if config.get("workers"):
+        return config["workers"]
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+# Loads in each worker, before its first rocket, what draw_worker would otherwise load lazily.
+# A failure is left to draw_worker, which reports it for each file instead of the pool breaking.
+def init_worker(font_path, base_paths):
+    try:
+        import merger, svgpathtools, openpyxl
+        import string
+        from svg_text import get_face, get_glyph
+        get_face(font_path)
+        for letter in string.ascii_uppercase + string.digits:
+            get_glyph(font_path, letter)
+        for base_path in base_paths:
+            merger.get_base_template(base_path)
+    except Exception:
+        pass
+
+# Largest workbooks first so that none is left alone at the end, the small ones grouped to spare the pool round trips
+def schedule(tasks, small_file_bytes, batch_size):
+    tasks = sorted(tasks, key=lambda task: os.path.getsize(task[0]), reverse=True)
+    batches = [[task] for task in tasks if os.path.getsize(task[0]) > small_file_bytes]
+    small_tasks = tasks[len(batches):]
+    batches += [small_tasks[i:i + batch_size] for i in range(0, len(small_tasks), batch_size)]
+    return batches
 
 def main():
     from glob import glob
     from tqdm import tqdm
     import os, json
     from pathlib import Path
-    from svg2pdf import bulk_convert
+    from PyPDF2 import PdfMerger
+    import io
     from concurrent.futures import ProcessPoolExecutor, as_completed
     
     os.makedirs("errors", exist_ok=True)
     os.makedirs("output_rockets", exist_ok=True)
-    files = [file for file in glob("cache/*.xlsx") if not "_temp." in file]
+    files = [file for file in glob("cache/*.xlsx") + glob("cache/*.xls") if not "_temp." in file]
     errors = list()
     
     with open("config.json") as f:
-        bases = json.load(f)["bases"]
+        config = json.load(f)
+    bases = config["bases"]
+    scheduler_config = config.get("scheduler", dict())
     
     with open("cache/project_list.json", "r", encoding="utf-8") as f:
         project_data = {project["id"]: project for project in json.load(f)["project_list"]}
     
-    pool = ProcessPoolExecutor(max_workers=4)
-    futures = list()
+    tasks = list()
     for file in files:
         project = project_data[Path(file).name.split("_")[0]]
-        futures.append(pool.submit(draw_worker, file, project, bases[project["type"]]))
+        tasks.append((file, project, bases[project["type"]]))
+    batches = schedule(tasks, scheduler_config.get("small_file_bytes", 32*1024), scheduler_config.get("batch_size", 4))
 
-    progress_bar = tqdm(total=len(futures), desc="Dessin des fusées")
+    progress_bar = tqdm(total=len(tasks), desc="Dessin des fusées")
     progress_bar.set_postfix({"errors": len(errors)})
-    for future in as_completed(futures):
-        progress_bar.update(1)
-        result = future.result()
-        if result is not None:
-            e, file = result
-            errors.append((file, e))
-            os.rename(file, Path("errors")/Path(file).name)
-            progress_bar.set_postfix({"errors": len(errors)})
+    pages = dict()
+    base_paths = [base["path"] for base in bases.values()]
+    with ProcessPoolExecutor(max_workers=worker_count(config), initializer=init_worker, initargs=(default_font_path, base_paths)) as pool:
+        futures = [pool.submit(tracing.run, draw_batch, batch, pdf_page=True) for batch in batches]
+        for future in as_completed(futures):
+            results, worker_spans = future.result()
+            tracing.add(worker_spans)
+            progress_bar.update(len(results))
+            for e, file, page in results:
+                if e is None:
+                    pages[Path(file).stem] = page
+                else:
+                    errors.append((file, e))
+                    os.rename(file, Path("errors")/Path(file).name)
+                    progress_bar.set_postfix({"errors": len(errors)})
 
     progress_bar.close()
     
     for error in errors:
         print(f" - Erreur sur le fichier {Path(error[0]).name}: ({type(error[1]).__name__}) {error[1]}")
         
-    bulk_convert("output_rockets/*.svg", "output_rockets.pdf")
+    # Pages are drawn by the workers straight from the geometry, in the order of the rocket files
+    merger = PdfMerger()
+    for stem in sorted(pages):
+        merger.append(io.BytesIO(pages[stem]))
+    with open("output_rockets.pdf", "wb") as f:
+        merger.write(f)
+    merger.close()
+    tracing.write()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,82 @@
+import numpy as np
+
+# Polygons are (n, 2) float arrays, series are dicts of polygons
+
+def as_polygon(points):
+    return np.asarray(points, dtype=float).reshape(-1, 2)
+
+def clean_polygon(polygon):
+    if len(polygon) == 0 or (polygon == polygon[0]).all(): return None
+    keep = np.ones(len(polygon), dtype=bool)
+    keep[1:] = (polygon[1:] != polygon[:-1]).any(axis=1)
+    return polygon[keep]
+
+def clean_series(series):
+    clean_series = dict()
+    for poly_name, polygon in series.items():
+        polygon = as_polygon(polygon)
+        # Empty or text cells are read as NaN
+        clean_poly = clean_polygon(polygon[np.isfinite(polygon).all(axis=1)])
+        if clean_poly is not None:
+            clean_series[poly_name] = clean_poly
+    return clean_series
+
+def close_polygon(polygon):
+    if (polygon[0] != polygon[-1]).any():
+        return np.vstack((polygon, polygon[:1]))
+    return polygon
+
+def offset_contacts(polygon, contact_indices, offset):
+    # Moves the contact points towards the axis, the side being given by the third point
+    sign = 1 if polygon[2, 0] > 0 else -1
+    contact_indices = [index for index in contact_indices if index < len(polygon)]
+    polygon = polygon.copy()
+    polygon[contact_indices, 0] -= sign*offset
+    return polygon
+
+def clamp_monotonic(polygon):
+    polygon = polygon.copy()
+    polygon[:, 1] = np.minimum.accumulate(polygon[:, 1])
+    return polygon
+
+def base_point(polygon):
+    # Point the furthest from y=0, the furthest from the axis among those
+    if len(polygon) == 0: return np.zeros(2, dtype=int)
+    order = np.lexsort((-np.abs(polygon[:, 0]), -np.abs(polygon[:, 1])))
+    return polygon[order[0]].astype(int)
+
+def nearest_points(points, candidates):
+    distances = np.hypot(points[:, None, 0] - candidates[None, :, 0], points[:, None, 1] - candidates[None, :, 1])
+    return candidates[np.argmin(distances, axis=1)]
+
+def outline_segments(outline, base_points):
+    # Segments of a closed outline, edges lying on the base being split around the base points
+    outline, base_points = np.asarray(outline), np.asarray(base_points)
+    is_base = (outline[:, None, :] == base_points[None, :, :]).all(axis=2).any(axis=1)
+    previous, current = outline[:-2], outline[1:-1]
+
+    skip = is_base[:-2] & is_base[1:-1]
+    on_base = ~skip & (previous[:, 1] == current[:, 1]) & (current[:, 1] == base_points[0, 1])
+
+    first_end = np.where(on_base[:, None], nearest_points(previous, base_points), current)
+    first = np.stack((previous, first_end), axis=1)
+    second = np.stack((nearest_points(current, base_points), current), axis=1)
+
+    keep = np.stack((~skip, on_base), axis=1)
+    segments = np.stack((first, second), axis=1)[keep]
+    closing = np.array([[segments[-1, 1], segments[0, 0]]])
+    return np.concatenate((segments, closing))
+
+def chain_segments(segments, precision=None):
+    # Joins segments following each other into polylines
+    segments = np.asarray(segments, dtype=float).reshape(-1, 2, 2)
+    if precision is not None:
+        segments = np.round(segments, precision)
+    if len(segments) == 0: return []
+    
+    breaks = np.flatnonzero((segments[1:, 0] != segments[:-1, 1]).any(axis=1)) + 1
+    polylines = [np.vstack((chain[:, 0], chain[-1:, 1])) for chain in np.split(segments, breaks)]
+    # The last polyline wraps around to the first one on closed outlines
+    if len(polylines) > 1 and (polylines[-1][-1] == polylines[0][0]).all():
+        polylines[0] = np.vstack((polylines.pop()[:-1], polylines[0]))
+    return polylines
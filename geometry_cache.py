@@ -0,0 +1,70 @@
+import hashlib
+import os
+from pathlib import Path
+import numpy as np
+
+cache_extension = ".npz"
+
+class GeometryCache():
+
+    def __init__(self, directory, version, max_bytes=256*1024**2):
+        self.directory = Path(directory)
+        self.version = version
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, workbook_path):
+        digest = hashlib.sha256()
+        with open(workbook_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return self.directory/f"{key}_{self.version}{cache_extension}"
+
+    def load(self, key):
+        path = self.entry_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {"series": dict(), "series_polys": dict(), "body_base_points": None}
+                for name in data.files:
+                    group, _, serie_name = name.partition("/")
+                    if group == "series":
+                        entry["series"][serie_name] = data[name]
+                    elif group == "polys":
+                        entry["series_polys"][serie_name] = data[name]
+                    elif group == "body_base_points":
+                        entry["body_base_points"] = data[name]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        os.utime(path)
+        return entry
+
+    def store(self, key, series, series_polys, body_base_points):
+        arrays = {f"series/{name}": np.asarray(points, dtype=float) for name, points in series.items()}
+        arrays.update({f"polys/{name}": np.asarray(points, dtype=float) for name, points in series_polys.items()})
+        arrays["body_base_points"] = np.asarray(body_base_points, dtype=int)
+
+        path = self.entry_path(key)
+        temp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        entries = list()
+        for path in self.directory.glob(f"*{cache_extension}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes: break
+            path.unlink(missing_ok=True)
+            total_size -= size
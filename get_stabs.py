@@ -1,30 +1,105 @@
 import requests, json
-import os, time
+import os, time, threading, hashlib
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from bs4 import BeautifulSoup
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm
 from subprocess import Popen
 from sanitize_filename import sanitize
+from project_page import parse_project_page, ProjectPageError
+import tracing
 
 max_workers = 3
+chunk_size = 1 << 16
 
 with open("config.json") as f:
     config = json.load(f)
 
+base_url = config.get("base_url", "https://www.planete-sciences.org").rstrip("/")
+fetch_workers = config.get("fetch_workers", 8)
+manifest_path = Path("cache")/Path("manifest.json")
+# Legacy .xls workbooks are read in process by workbook.py, the conversion through Excel (convert.vbs, Windows only) is opt-in
+excel_conversion = config.get("excel_conversion", False)
+
 os.makedirs("cache", exist_ok=True)
 os.makedirs("errors", exist_ok=True)
 os.makedirs("cache/raw_files", exist_ok=True)
 session = requests.Session()
 session.headers = {"Cookie": config["cookies"], "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/102.0.0.0 Safari/537.36"}
-    
+# One keep-alive connection per fetch worker, transient errors retried with exponential backoff
+retry = Retry(total=config.get("fetch_retries", 3), backoff_factor=config.get("fetch_backoff", 0.5), status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=fetch_workers, max_retries=retry)
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+class RateLimiter():
+
+    def __init__(self, requests_per_second):
+        self.interval = 1/requests_per_second if requests_per_second else 0
+        self.next_times = dict()
+        self.lock = threading.Lock()
+
+    def wait(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_times.get(host, now))
+            self.next_times[host] = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+rate_limiter = RateLimiter(config.get("requests_per_second", 4))
+
+def fetch(url, **kwargs):
+    rate_limiter.wait(url)
+    req = session.get(url, **kwargs)
+    req.raise_for_status()
+    return req
+
+def conditional_headers(validators):
+    headers = dict()
+    if validators is not None:
+        if validators.get("etag") is not None: headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified") is not None: headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+def get_validators(req):
+    return {"etag": req.headers.get("ETag"), "last_modified": req.headers.get("Last-Modified")}
+
+# Returns the validators and content hash of the downloaded file, None when the server answered Not Modified
+def download(url, path, validators=None):
+    # Streamed to a part file so that an interrupted download is not taken for a cached one
+    part_path = Path(f"{path}.part")
+    digest = hashlib.sha256()
+    with fetch(url, stream=True, headers=conditional_headers(validators)) as req:
+        if req.status_code == 304: return None
+        with open(part_path, "wb") as f:
+            for chunk in req.iter_content(chunk_size):
+                digest.update(chunk)
+                f.write(chunk)
+    os.replace(part_path, path)
+    return {**get_validators(req), "sha256": digest.hexdigest()}
+
+def load_manifest():
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return dict()
+
+def save_manifest(manifest):
+    temp_path = manifest_path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(temp_path, manifest_path)
+
 def get_path_from_id(project_id):
     return Path("cache")/Path(f"{project_id}.xlsx")
 
 def get_projects():
-    url = f"https://www.planete-sciences.org/espace/scae/index.php?p=api&key={config['api_key']}"
-    req = session.get(url)
-    req.raise_for_status()
+    req = fetch(f"{base_url}/espace/scae/index.php?p=api&key={config['api_key']}")
     
     output = list()
     for project in req.json():
@@ -34,12 +109,11 @@ def get_projects():
     return output
 
 def convert_workbook(from_path, dest_path):
-    process = Popen(f".\\convert.vbs \"{from_path}\" \"{dest_path}\"", shell=True)
-    
-    while process.poll() == None:
-        time.sleep(1)
+    with tracing.span("conversion", file=Path(from_path).name):
+        process = Popen(f".\\convert.vbs \"{from_path}\" \"{dest_path}\"", shell=True)
+        return_code = process.wait()
     
-    if process.poll() != 0:
+    if return_code != 0:
         os.rename(from_path, Path("errors") / Path(from_path).name)
         return False, from_path
     else:
@@ -47,105 +121,175 @@ def convert_workbook(from_path, dest_path):
         return True, from_path
 
 def get_url_from_id(project_id):
-    return f"https://www.planete-sciences.org/espace/scae/edit_project&id={project_id}"
+    return f"{base_url}/espace/scae/edit_project&id={project_id}"
 
-def get_project_details(project_id):
-    url = get_url_from_id(project_id)
-    req = session.get(url)
-    req.raise_for_status()
-    soup = BeautifulSoup(req.text, features="lxml")
+# Returns the project details, the conversion arguments if a workbook has to be converted, the updated manifest
+# entry and whether the stabtraj is "new", "changed" or "unchanged" since the entry was recorded
+def get_project_details(project_id, entry=None):
+    entry = dict(entry or {})
+    converted = "path" in entry and Path(entry["path"]).exists()
+    with tracing.span("project_page", file=project_id):
+        req = fetch(get_url_from_id(project_id), headers=conditional_headers(entry.get("page")))
+        if req.status_code == 304:
+            if "details" in entry and converted:
+                return entry["details"], None, entry, "unchanged"
+            # The workbook went missing (moved to errors/ for instance), the page is needed to download it again
+            req = fetch(get_url_from_id(project_id))
+        page = parse_project_page(req.text, config["campaign"])
+    if page is None: return "Invalid campaign", None, entry, None
     
-    try:
-        if soup.find("select", {"id": "project__campaign"}).find("option", {"selected": True}).text != config["campaign"]: return "Invalid campaign", None
-        
-        rce3_msg = soup.select(".border-rce3")
-        stabratjs = soup.find("h3", text="StabTraj's").parent.findAll("a")
-        last_stab = sorted((stab for stab in stabratjs), key=lambda x: int(x["href"].split("=")[-1]) if x["href"] != "#" else 0, reverse=True)[0]
-        last_stab_text = last_stab.parent.parent.select_one(".project-document-filename").text
-        
-        output = {
-            "project_name": soup.find("input", {"id": "project__name"})["value"],
-            "club_name": soup.find("select", {"id": "project__club"}).find("option", {"selected": True}).text,
-            "stabtraj_url": "https://www.planete-sciences.org/" + last_stab["href"],
-            "project_id": int(project_id),
-            "rce3": rce3_msg[-1].text if len(rce3_msg) > 0  else None
-        }
-        output["stabtraj_id"] = int(output['stabtraj_url'].split('=')[-1])
-        
-        stab_path = Path("cache")/Path(sanitize(f"{project_id}_{last_stab_text.replace(' ', '')}"))
-        if not stab_path.exists():
-            with open(stab_path, "wb") as f:
-                stab_req = session.get(output["stabtraj_url"])
-                stab_req.raise_for_status()
-                f.write(stab_req.content)
-            
-            if str(stab_path).endswith(".xlsx"):
-                temp_path = str(stab_path).replace(".xlsx", "_temp.xlsx")
-                os.rename(stab_path, temp_path)
-                new_path = str(stab_path.absolute())
-                stab_path = Path(temp_path)
-            else:
-                new_path = str(stab_path.absolute())+"x"
-            
-            return output, (stab_path.absolute(), new_path)
-        
-    except AttributeError as e:
-        print(e)
-        return None, None
-    finally:
-        pass
+    output = {
+        "project_name": page.project_name,
+        "club_name": page.club_name,
+        "stabtraj_url": f"{base_url}/" + page.stabtraj_href,
+        "project_id": int(project_id),
+        "rce3": page.rce3,
+        "stabtraj_id": page.stabtraj_id
+    }
     
-    return output, None
+    stab_path = Path("cache")/Path(sanitize(f"{project_id}_{page.stabtraj_filename.replace(' ', '')}"))
+    if not excel_conversion:
+        download_path, new_path = stab_path, stab_path
+    elif str(stab_path).endswith(".xlsx"):
+        download_path, new_path = Path(str(stab_path).replace(".xlsx", "_temp.xlsx")), stab_path
+    else:
+        download_path, new_path = stab_path, Path(f"{stab_path}x")
 
-def main():
-    projects = get_projects()
+    same_stab = entry.get("stabtraj_id") == output["stabtraj_id"] and entry.get("path") == str(new_path) and converted
+    previous_file = entry.get("file")
+    entry.update({"page": get_validators(req), "details": output, "stabtraj_id": output["stabtraj_id"]})
+    # The same stabtraj is only revalidated when the server gave validators for it
+    if same_stab and (previous_file is None or (previous_file["etag"] is None and previous_file["last_modified"] is None)):
+        return output, None, entry, "unchanged"
+
+    with tracing.span("download", file=download_path.name):
+        file_validators = download(output["stabtraj_url"], download_path, previous_file if same_stab else None)
+    if file_validators is None:
+        return output, None, entry, "unchanged"
+    entry["file"] = file_validators
+    
+    if previous_file is not None and previous_file["sha256"] == file_validators["sha256"]:
+        if converted:
+            # Same content under a new file name, the converted workbook is renamed instead of converted again
+            if download_path != new_path:
+                download_path.unlink()
+            if entry["path"] != str(new_path):
+                os.replace(entry["path"], new_path)
+                entry["path"] = str(new_path)
+            return output, None, entry, "unchanged"
+        status = "unchanged"
+    else:
+        status = "new" if previous_file is None else "changed"
+    # With the Excel conversion, the caller keeps the previous entry if the conversion fails
+    entry["path"] = str(new_path)
+    if not excel_conversion:
+        return output, None, entry, status
+    return output, (download_path.absolute(), str(new_path.absolute())), entry, status
+
+# Yields (project, project details, conversion arguments, manifest entry, status) as the projects are fetched,
+# projects that could not be fetched having None details and their error in fetch_errors
+def fetch_projects(projects, manifest, fetch_errors):
+    with ThreadPoolExecutor(max_workers=fetch_workers) as fetcher:
+        fetch_futures = {fetcher.submit(get_project_details, project["id"], manifest.get(str(project["id"]))): project for project in projects}
+        for future in as_completed(fetch_futures):
+            project = fetch_futures[future]
+            try:
+                result = future.result()
+            except (requests.RequestException, ProjectPageError) as e:
+                fetch_errors[project["id"]] = e
+                result = None, None, None, None
+            yield (project, *result)
+
+# Result of a project whose workbook could not be converted, its previous manifest entry being kept
+# so that the stabtraj is downloaded and converted again on the next run
+def conversion_failed(result, manifest):
+    project, project_details, converter_args, _, _ = result
+    return project, project_details, converter_args, manifest.get(str(project["id"])), None
+
+# Updates the manifest and writes the project list, failed projects being removed from projects.
+# Returns the new and changed stabtrajs and the missing projects.
+def save_fetch_results(projects, fetch_results, manifest):
     projects_details = list()
     missing_projects = list()
-    converter = ThreadPoolExecutor(max_workers=max_workers)
-    futures = list()
-    
-    progress_bar = tqdm(total=len(projects), desc="Téléchargement des stabtraj")
-    progress_bar.set_postfix({"errors": 0})
-    for project in projects:
-        progress_bar.update(1)
-        project_details, converter_args = get_project_details(project["id"])
+    updated_stabs = {"new": list(), "changed": list()}
+    for project, project_details, _, entry, status in fetch_results:
+        if entry is not None:
+            manifest[str(project["id"])] = entry
+        if status in updated_stabs:
+            updated_stabs[status].append(project)
+    save_manifest(manifest)
 
+    # Results are gathered in the project list order to keep the output stable between runs
+    order = {project["id"]: i for i, project in enumerate(projects)}
+    for project, project_details, *_ in sorted(fetch_results, key=lambda result: order[result[0]["id"]]):
         if project_details is None:
-            print(f"Error on project {project['name']}")
             missing_projects.append(project)
             projects.remove(project)
-            progress_bar.set_postfix({"errors": len(missing_projects)})
         elif project_details == "Invalid campaign":
             continue
         else:
             projects_details.append(project_details)
-        
-        if converter_args is not None:
-            futures.append(converter.submit(convert_workbook, *converter_args))
+    
+    with open(Path("cache")/Path("project_list.json"), "w", encoding="utf-8") as f:
+        json.dump({"project_details":projects_details, "project_list": projects, "missing_projects": missing_projects}, f, ensure_ascii=False)
+    return updated_stabs, missing_projects
+
+def print_fetch_report(fetch_results, updated_stabs, missing_projects, fetch_errors, manifest):
+    for status, title in [("new", "Nouveaux stabtraj"), ("changed", "Stabtraj modifiés")]:
+        if len(updated_stabs[status]) > 0:
+            print(f"{title}:")
+            for project in sorted(updated_stabs[status], key=lambda project: int(project["id"])):
+                print(f" - {project['name']}: {manifest[str(project['id'])]['path']}")
+    print(f"{sum(1 for *_, status in fetch_results if status == 'unchanged')} stabtraj inchangés")
+    
+    if len(missing_projects) > 0:
+        print("Erreurs de téléchargement:")
+        for error in missing_projects:
+            e = fetch_errors[error["id"]]
+            print(f" - {error['name']}:{get_url_from_id(error['id'])} ({type(e).__name__}) {e}")
+
+def main():
+    projects = get_projects()
+    converter = ThreadPoolExecutor(max_workers=max_workers)
+    futures = dict()
+    
+    manifest = load_manifest()
+    fetch_errors = dict()
+    fetch_results = list()
+    
+    progress_bar = tqdm(total=len(projects), desc="Téléchargement des stabtraj")
+    progress_bar.set_postfix({"errors": 0})
+    for result in fetch_projects(projects, manifest, fetch_errors):
+        progress_bar.update(1)
+        fetch_results.append(result)
+        progress_bar.set_postfix({"errors": len(fetch_errors)})
+        if result[2] is not None:
+            futures[converter.submit(convert_workbook, *result[2])] = len(fetch_results) - 1
+    progress_bar.close()
 
     progress_bar = tqdm(total=len(futures), desc="Conversion des stabtraj")
     progress_bar.set_postfix({"errors": 0})
     errors = list()
     for future in as_completed(futures):
         result = future.result()
-        if not result[0]: errors.append(result[1])
+        if not result[0]:
+            errors.append(result[1])
+            fetch_results[futures[future]] = conversion_failed(fetch_results[futures[future]], manifest)
         progress_bar.update(1)
         progress_bar.set_postfix({"errors": len(errors)})
     progress_bar.close()
-        
-    with open(Path("cache")/Path("project_list.json"), "w", encoding="utf-8") as f:
-        json.dump({"project_details":projects_details, "project_list": projects, "missing_projects": missing_projects}, f, ensure_ascii=False)
+
+    # The manifest is only saved once the conversions are done
+    updated_stabs, missing_projects = save_fetch_results(projects, fetch_results, manifest)
     
-    if len(missing_projects) > 0:
-        print("Erreurs de téléchargement:")
-        for error in missing_projects:
-            print(f" - {error['name']}:{get_url_from_id(error['id'])}")
+    print_fetch_report(fetch_results, updated_stabs, missing_projects, fetch_errors, manifest)
     
     if len(errors) > 0:
         print("Erreurs de conversion:")
         for error in errors:
             print(f" - {Path(error).name}")
-        
+    
+    tracing.write()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,17 +1,35 @@
 import svgutils
 from svgpathtools import svg2paths
-import re
+from svgpathtools.parser import parse_transform
+from svgpathtools.path import transform
+import re, json
+from copy import deepcopy
+from lxml import etree
 from pathlib import Path
+import packing
+import tracing
 
 mm_per_pix = 2.8346
 margin_mm = 0.4
+platter_dims = (601, 301)
 
 viewbox_regex = re.compile(r'viewBox="(\d+?\.?\d*?) (\d+?\.?\d*?) (\d+?\.?\d*?) (\d+?\.?\d*?)"')
-edit_regex = re.compile(r'(<svg.*?)>')
+edit_regex = re.compile(r'(<svg.*?)>', re.DOTALL)
 margin_px = margin_mm*mm_per_pix
 
 def svg_bbox(path):
     paths, attributes = svg2paths(path)
+    # Glyphs are defined once in <defs> and placed with <use>, svg2paths reads the definitions but not the uses
+    tree = etree.parse(str(path))
+    defined_ids = {element.get("id") for defs in tree.iter(svgutils.transform.SVG + "defs") for element in defs.iter() if element.get("id") is not None}
+    definitions = {attribute["id"]: svg_path for svg_path, attribute in zip(paths, attributes) if attribute.get("id") in defined_ids}
+    paths = [svg_path for svg_path, attribute in zip(paths, attributes) if attribute.get("id") not in defined_ids]
+    for use in tree.iter(svgutils.transform.SVG + "use"):
+        href = use.get(svgutils.transform.XLINK + "href") or use.get("href") or ""
+        if href[1:] not in definitions: continue
+        matrix = parse_transform(use.get("transform")) @ parse_transform(f"translate({use.get('x', 0)} {use.get('y', 0)})")
+        paths.append(transform(definitions[href[1:]], matrix))
+
     xmin, xmax, ymin, ymax = 0, 0, 0, 0
     for path in paths:
         path_bbox = path.bbox()
@@ -22,8 +40,21 @@ def svg_bbox(path):
         
     return xmin, xmax, ymin, ymax
 
+def metadata_path(svg_path):
+    return Path(svg_path).with_suffix(".json")
+
+# Rockets drawn by StabDrawing.draw(path, metadata=True) have their bbox in a sidecar file
+def rocket_bbox(svg_path):
+    try:
+        with open(metadata_path(svg_path), "r", encoding="utf-8") as f:
+            return tuple(json.load(f)["bbox"])
+    except (FileNotFoundError, KeyError, ValueError):
+        return svg_bbox(svg_path)
+
 def get_scale(svg_path, target_size):
-    bbox = svg_bbox(svg_path)
+    return get_scale_from_bbox(rocket_bbox(svg_path), target_size)
+
+def get_scale_from_bbox(bbox, target_size):
     orig_dims = bbox[1] - bbox[0], bbox[3] - bbox[2]
     
     inverse_scales = orig_dims[1]/(target_size[0]/mm_per_pix), orig_dims[0]/(target_size[1]/mm_per_pix)
@@ -34,68 +65,118 @@ def get_scale(svg_path, target_size):
     return scale
 
 def apply_svg(base_data, rocket_path, output_path):
+    with tracing.span("scale"):
+        bbox = rocket_bbox(rocket_path)
+    with open(rocket_path, "r", encoding="utf-8") as f:
+        rocket_svg = f.read()
+    
+    card_svg = compose_card(base_data, rocket_svg, bbox)
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(card_svg)
+
+# Returns the card of a rocket as an SVG string, the rocket being given as an SVG string and its bbox
+def compose_card(base_data, rocket_svg, bbox):
     base_path, rectangle_coords, target_size = base_data["path"], base_data["rectangle_coords"], base_data["rectangle_size"]
-    bbox = svg_bbox(rocket_path)
+    scale = get_scale_from_bbox(bbox, target_size)
     orig_dims = bbox[1] - bbox[0], bbox[3] - bbox[2]
-    inverse_scales = orig_dims[1]/(target_size[0]/mm_per_pix), orig_dims[0]/(target_size[1]/mm_per_pix)
-    inverse_scale = max(*inverse_scales)
-    new_dims = orig_dims[0]*mm_per_pix/inverse_scale, orig_dims[1]*mm_per_pix/inverse_scale
+    new_dims = orig_dims[0]*scale/mm_per_pix, orig_dims[1]*scale/mm_per_pix
     
-    scale = (mm_per_pix**2)/(inverse_scale)
-    rocket = svgutils.compose.SVG(rocket_path)
-    rocket.rotate(90, 0,0)
-    translate_x = orig_dims[1] + (rectangle_coords[0] + 0.5*(target_size[0] - new_dims[1]))*mm_per_pix/scale
-    translate_y = orig_dims[0]/2 + (rectangle_coords[1] + 0.5*(target_size[1] - new_dims[0]))*mm_per_pix/scale
-    rocket.move(f"{translate_x}mm", f"{translate_y}mm")
-    rocket.scale(scale)
-
-    figure = svgutils.transform.fromfile(base_path)
-    figure.append(rocket)
-    figure.save(output_path)
-    set_svg_size(output_path)
-
-def set_svg_size(path):
-    with open(path, "r") as f:
-        svg_data = f.read()
+    with tracing.span("card_composition"):
+        rocket = svgutils.compose.Element(svgutils.transform.fromstring(rocket_svg).getroot().root)
+        rocket.rotate(90, 0,0)
+        translate_x = orig_dims[1] + (rectangle_coords[0] + 0.5*(target_size[0] - new_dims[1]))*mm_per_pix/scale
+        translate_y = orig_dims[0]/2 + (rectangle_coords[1] + 0.5*(target_size[1] - new_dims[0]))*mm_per_pix/scale
+        rocket.move(f"{translate_x}mm", f"{translate_y}mm")
+        rocket.scale(scale)
+    
+        head, tail = get_base_template(base_path)
+        return head + rocket.tostr().decode() + tail
+
+# Base templates are parsed once per process and split where the rocket is inserted
+base_templates = dict()
+
+def get_base_template(base_path):
+    if base_path not in base_templates:
+        with open(base_path, "r", encoding="utf-8") as f:
+            svg_data = f.read()
+        end_index = svg_data.rindex("</svg>")
+        base_templates[base_path] = (add_svg_size(svg_data[:end_index]), svg_data[end_index:])
+    return base_templates[base_path]
+
+def add_svg_size(svg_data):
     svg_viewbox = re.findall(viewbox_regex, svg_data)[0]
     svg_viewbox = [float(coord) for coord in svg_viewbox]
-    svg_data = re.sub(edit_regex, f'\g<1> width="{svg_viewbox[2]-svg_viewbox[0]}" height="{svg_viewbox[3]-svg_viewbox[1]}">', svg_data)    
-    with open(path, "w") as f:
-        f.write(svg_data)
+    return re.sub(edit_regex, f'\\g<1> width="{svg_viewbox[2]-svg_viewbox[0]}" height="{svg_viewbox[3]-svg_viewbox[1]}">', svg_data, count=1)
 
-def merge_platters(cards, platter_dims, output_dir, prefix=""):
-    platter_number = 0
-    
-    current_coords = [0, 0]
-    svg_elements = list()
+# Parsed card, as svgutils.compose.SVG would give for the card file
+class Card():
+
+    def __init__(self, figure):
+        self.root = figure.getroot().root
+        self.width = svgutils.compose.Unit(figure.width).to("px").value
+        self.height = svgutils.compose.Unit(figure.height).to("px").value
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(svgutils.transform.fromfile(path))
+
+    @classmethod
+    def from_string(cls, svg_data):
+        return cls(svgutils.transform.fromstring(svg_data))
+
+def get_platter_size(platter_dims):
+    return tuple(dim*mm_per_pix for dim in platter_dims)
+
+def merge_platters(cards, platter_dims, output_dir, prefix="", strategy="maxrects", rotate=False):
+    platter_size = get_platter_size(platter_dims)
+    # Copies of a card share one parsed definition, placed with <use>
+    svg_cards = {card_path: Card.from_file(card_path) for card_path in dict.fromkeys(cards)}
+    with tracing.span("packing", platters=prefix):
+        bins = packing.pack([(svg_cards[card_path].width, svg_cards[card_path].height) for card_path in cards], platter_size, strategy, rotate, margin_px)
     
-    for card_path in cards:
-        card = svgutils.compose.SVG(card_path)
-        card_dims = (card.width, card.height)
-        
-        if (current_coords[0]+card_dims[0])/mm_per_pix > platter_dims[0]:
-            current_coords[1] += card_dims[1] + margin_px
-            current_coords[0] = 0
+    write_platters(bins, cards, svg_cards, platter_size, output_dir, prefix)
+    return [platter_bin.utilisation for platter_bin in bins]
+
+# Writes packed bins as platters, cards being the card key of each placed index and svg_cards the parsed card of each key.
+# Only the platters in platter_numbers are written when given.
+def write_platters(bins, cards, svg_cards, platter_size, output_dir, prefix="", platter_numbers=None):
+    card_ids = {card_key: f"card-{index}" for index, card_key in enumerate(dict.fromkeys(cards))}
+    for platter_number, platter_bin in enumerate(bins):
+        if platter_numbers is not None and platter_number not in platter_numbers: continue
+        defs = etree.Element(svgutils.transform.SVG + "defs")
+        defined = set()
+        svg_elements = [svgutils.compose.Element(defs)]
+        for index, x, y, rotated in sorted(platter_bin.placements):
+            card_key = cards[index]
+            card = svg_cards[card_key]
+            if card_key not in defined:
+                definition = deepcopy(card.root)
+                definition.set("id", card_ids[card_key])
+                defs.append(definition)
+                defined.add(card_key)
+            
+            transform = f"translate({x + card.height}, {y}) rotate(90)" if rotated else f"translate({x}, {y})"
+            use = etree.Element(svgutils.transform.SVG + "use", {svgutils.transform.XLINK + "href": f"#{card_ids[card_key]}", "transform": transform})
+            svg_elements.append(svgutils.compose.Element(use))
         
-        if (current_coords[1]+card_dims[1])/mm_per_pix > platter_dims[1]:
-            platter = svgutils.compose.Figure(*(dim*mm_per_pix for dim in platter_dims), *svg_elements)
+        with tracing.span("platter_write", file=f"{prefix}_{platter_number}.svg"):
+            platter = svgutils.compose.Figure(*platter_size, *svg_elements)
             platter.save(Path(output_dir)/f"{prefix}_{platter_number}.svg")
-            current_coords = [0, 0]
-            svg_elements = list()
-            platter_number += 1
-        
-        translate_coords = current_coords
-        card.move(*translate_coords)
-        svg_elements.append(card)
-        current_coords[0] = current_coords[0] + card_dims[0] + margin_px
-        
 
-    platter = svgutils.compose.Figure(*(dim*mm_per_pix for dim in platter_dims), *svg_elements)
-    platter.save(Path(output_dir)/f"{prefix}_{platter_number}.svg")
- 
+def card_worker(base_data, rocket_path, output_path):
+    try:
+        with tracing.span("card", file=Path(rocket_path).name):
+            apply_svg(base_data, rocket_path, output_path)
+    except Exception as e:
+        return e, rocket_path
+    
+    return None
+
 def main():
     import glob, json, os
     from pathlib import Path
+    from tqdm import tqdm
+    from concurrent.futures import ProcessPoolExecutor, as_completed
     os.makedirs("output_cards", exist_ok=True)
     os.makedirs("output_platters", exist_ok=True)
     
@@ -105,20 +186,52 @@ def main():
         config = json.load(f)
     base_data = config["bases"]
     minif_copies, fusex_copies = config["minif_copies"], config["fusex_copies"]
-        
-    for rocket in glob.glob("output_rockets/*.svg"):
+    
+    cards = list()
+    for rocket in sorted(glob.glob("output_rockets/*.svg")):
         rocket_type = project_types[Path(rocket).name.split("_")[0]]
-        rocket_base_data = base_data[rocket_type]
-        apply_svg(rocket_base_data, rocket, rocket.replace("output_rockets","output_cards").replace(".svg", f"_{rocket_type}.svg"))
+        cards.append((rocket, rocket.replace("output_rockets","output_cards").replace(".svg", f"_{rocket_type}.svg"), rocket_type))
+    
+    errors = list()
+    with ProcessPoolExecutor(max_workers=config.get("workers")) as pool:
+        futures = {pool.submit(tracing.run, card_worker, base_data[rocket_type], rocket, card_path): card_path for rocket, card_path, rocket_type in cards}
+        
+        progress_bar = tqdm(total=len(futures), desc="Création des cartes")
+        progress_bar.set_postfix({"errors": len(errors)})
+        for future in as_completed(futures):
+            progress_bar.update(1)
+            result, worker_spans = future.result()
+            tracing.add(worker_spans)
+            if result is not None:
+                errors.append((futures[future], result))
+                progress_bar.set_postfix({"errors": len(errors)})
+        progress_bar.close()
+    
+    failed_cards = {card_path for card_path, _ in errors}
+    for _, (e, rocket) in errors:
+        print(f" - Erreur sur le fichier {Path(rocket).name}: ({type(e).__name__}) {e}")
     
-    platter_dims = (601, 301)
-    list_minif = [card_path for card_path in glob.glob("output_cards/*.svg") if card_path.endswith("minif.svg")]*minif_copies
-    list_fusex = [card_path for card_path in glob.glob("output_cards/*.svg") if card_path.endswith("fusex.svg")]*fusex_copies
+    # Same order as the sequential version whatever the completion order
+    card_paths = [card_path for _, card_path, _ in cards if card_path not in failed_cards]
+    
+    packing_config = config.get("packing", dict())
+    strategy, rotate = packing_config.get("strategy", "maxrects"), packing_config.get("rotate", False)
+    list_minif = [card_path for card_path in card_paths if card_path.endswith("minif.svg")]*minif_copies
+    list_fusex = [card_path for card_path in card_paths if card_path.endswith("fusex.svg")]*fusex_copies
     list_minif.sort()
     list_fusex.sort()
-    merge_platters(list_fusex, platter_dims, "output_platters", prefix="fusex")
-    merge_platters(list_minif, platter_dims, "output_platters", prefix="minif")
+    if packing_config.get("mix_types", False):
+        platter_groups = {"mixed": list_fusex + list_minif}
+    else:
+        platter_groups = {"fusex": list_fusex, "minif": list_minif}
+    
+    for prefix, platter_cards in platter_groups.items():
+        if len(platter_cards) == 0: continue
+        utilisations = merge_platters(platter_cards, platter_dims, "output_platters", prefix=prefix, strategy=strategy, rotate=rotate)
+        for platter_number, utilisation in enumerate(utilisations):
+            print(f" - {prefix}_{platter_number}: {utilisation:.0%} utilisé")
     print(f"Plateau(x) nécéssaires: {len(glob.glob('output_platters/*.svg'))}")
+    tracing.write()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
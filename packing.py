@@ -0,0 +1,173 @@
+epsilon = 1e-9
+
+class Bin():
+
+    def __init__(self, width, height):
+        self.width, self.height = width, height
+        self.placements = list()
+        self.used_area = 0
+        self.utilisation = 0
+
+    def insert(self, index, width, height, rotate=False):
+        position = self.find_position(width, height, rotate)
+        if position is None:
+            return None
+        x, y, rotated = position
+        placed_width, placed_height = (height, width) if rotated else (width, height)
+        self.place(x, y, placed_width, placed_height)
+        self.placements.append((index, x, y, rotated))
+        return position
+
+    def orientations(self, width, height, rotate):
+        yield width, height, False
+        if rotate and abs(width - height) > epsilon:
+            yield height, width, True
+
+def fits(width, height, free_width, free_height):
+    return width <= free_width + epsilon and height <= free_height + epsilon
+
+class ShelfBin(Bin):
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.shelves = list() # [y, height, used width]
+
+    def find_position(self, width, height, rotate):
+        best = None
+        for shelf in self.shelves:
+            for item_width, item_height, rotated in self.orientations(width, height, rotate):
+                if fits(item_width, item_height, self.width - shelf[2], shelf[1]):
+                    score = shelf[1] - item_height
+                    if best is None or score < best[0]:
+                        best = score, (shelf[2], shelf[0], rotated), shelf
+        if best is not None:
+            return best[1]
+
+        top = sum(shelf[1] for shelf in self.shelves)
+        for item_width, item_height, rotated in sorted(self.orientations(width, height, rotate), key=lambda orientation: orientation[1]):
+            if fits(item_width, item_height, self.width, self.height - top):
+                return 0, top, rotated
+        return None
+
+    def place(self, x, y, width, height):
+        for shelf in self.shelves:
+            if shelf[0] == y:
+                shelf[2] = x + width
+                return
+        self.shelves.append([y, height, x + width])
+
+class GuillotineBin(Bin):
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.free_rects = [(0, 0, width, height)]
+
+    def find_position(self, width, height, rotate):
+        best = None
+        for free_rect in self.free_rects:
+            for item_width, item_height, rotated in self.orientations(width, height, rotate):
+                if fits(item_width, item_height, free_rect[2], free_rect[3]):
+                    score = free_rect[2]*free_rect[3] - item_width*item_height
+                    if best is None or score < best[0]:
+                        best = score, (free_rect[0], free_rect[1], rotated)
+        return None if best is None else best[1]
+
+    def place(self, x, y, width, height):
+        free_rect = next(rect for rect in self.free_rects if rect[0] == x and rect[1] == y and fits(width, height, rect[2], rect[3]))
+        self.free_rects.remove(free_rect)
+        _, _, free_width, free_height = free_rect
+
+        # Split along the shorter leftover axis
+        if free_width - width < free_height - height:
+            right = (x + width, y, free_width - width, height)
+            bottom = (x, y + height, free_width, free_height - height)
+        else:
+            right = (x + width, y, free_width - width, free_height)
+            bottom = (x, y + height, width, free_height - height)
+        self.free_rects.extend(rect for rect in (right, bottom) if rect[2] > epsilon and rect[3] > epsilon)
+
+class MaxRectsBin(Bin):
+
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.free_rects = [(0, 0, width, height)]
+
+    def find_position(self, width, height, rotate):
+        # Best short side fit
+        best = None
+        for free_rect in self.free_rects:
+            for item_width, item_height, rotated in self.orientations(width, height, rotate):
+                if fits(item_width, item_height, free_rect[2], free_rect[3]):
+                    leftover = free_rect[2] - item_width, free_rect[3] - item_height
+                    score = min(leftover), max(leftover)
+                    if best is None or score < best[0]:
+                        best = score, (free_rect[0], free_rect[1], rotated)
+        return None if best is None else best[1]
+
+    def place(self, x, y, width, height):
+        free_rects = list()
+        for free_x, free_y, free_width, free_height in self.free_rects:
+            if x >= free_x + free_width - epsilon or x + width <= free_x + epsilon or y >= free_y + free_height - epsilon or y + height <= free_y + epsilon:
+                free_rects.append((free_x, free_y, free_width, free_height))
+                continue
+            if x > free_x + epsilon:
+                free_rects.append((free_x, free_y, x - free_x, free_height))
+            if x + width < free_x + free_width - epsilon:
+                free_rects.append((x + width, free_y, free_x + free_width - x - width, free_height))
+            if y > free_y + epsilon:
+                free_rects.append((free_x, free_y, free_width, y - free_y))
+            if y + height < free_y + free_height - epsilon:
+                free_rects.append((free_x, y + height, free_width, free_y + free_height - y - height))
+
+        self.free_rects = [rect for i, rect in enumerate(free_rects) if not any(
+            j != i and contains(other, rect) and (other != rect or j < i) for j, other in enumerate(free_rects)
+        )]
+
+def contains(outer, inner):
+    return (inner[0] >= outer[0] - epsilon and inner[1] >= outer[1] - epsilon
+            and inner[0] + inner[2] <= outer[0] + outer[2] + epsilon
+            and inner[1] + inner[3] <= outer[1] + outer[3] + epsilon)
+
+strategies = {
+    "shelf": ShelfBin,
+    "guillotine": GuillotineBin,
+    "maxrects": MaxRectsBin
+}
+
+# Places items in the first open bin they fit in, opening a new bin otherwise. Items can be added as they come,
+# margin being kept between items.
+class Packer():
+
+    def __init__(self, bin_size, strategy="maxrects", rotate=False, margin=0):
+        self.bin_class = strategies[strategy]
+        self.bin_size = bin_size
+        self.rotate = rotate
+        self.margin = margin
+        self.bins = list()
+
+    def add(self, index, size):
+        width, height = size[0] + self.margin, size[1] + self.margin
+        for bin_index, packing_bin in enumerate(self.bins):
+            if packing_bin.insert(index, width, height, self.rotate) is not None:
+                self.update_utilisation(packing_bin, size)
+                return bin_index
+        
+        packing_bin = self.bin_class(self.bin_size[0] + self.margin, self.bin_size[1] + self.margin)
+        if packing_bin.insert(index, width, height, self.rotate) is None:
+            raise ValueError(f"Item {index} of size {size} doesn't fit in {self.bin_size}")
+        self.bins.append(packing_bin)
+        self.update_utilisation(packing_bin, size)
+        return len(self.bins) - 1
+
+    def update_utilisation(self, packing_bin, size):
+        packing_bin.used_area += size[0]*size[1]
+        packing_bin.utilisation = packing_bin.used_area/(self.bin_size[0]*self.bin_size[1])
+
+# Packs the (width, height) sizes in as few bins as possible, a margin being kept between items.
+# Returns the bins, with placements as (size index, x, y, rotated) and the used area ratio as utilisation.
+def pack(sizes, bin_size, strategy="maxrects", rotate=False, margin=0):
+    packer = Packer(bin_size, strategy, rotate, margin)
+    # Largest items first gives far better packings than the arrival order
+    for index in sorted(range(len(sizes)), key=lambda i: (-max(sizes[i]), -sizes[i][0]*sizes[i][1], i)):
+        packer.add(index, sizes[index])
+    return packer.bins
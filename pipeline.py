@@ -0,0 +1,205 @@
+import io, json, os, queue, threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from glob import glob
+from pathlib import Path
+from PyPDF2 import PdfMerger
+from tqdm import tqdm
+import packing
+import tracing
+from geometry_cache import GeometryCache
+from draw import StabDrawing, geometry_cache_dir, geometry_version, geometry_cache_max_bytes, default_font_path, init_worker, worker_count
+from merger import Card, compose_card, get_scale_from_bbox, get_platter_size, write_platters, mm_per_pix, margin_px, platter_dims
+
+# Rockets go from the fetch thread to the drawing pool and back to the packers without intermediate files,
+# rockets and cards being only written when asked for with the "pipeline" config keys.
+
+# Returns (error, file, (card SVG data, PDF page)), the rocket and its sidecar being written when keep_rocket is set
+def rocket_worker(file, project, base_config, keep_rocket=False):
+    try:
+        with tracing.span("rocket", file=Path(file).name):
+            cache = GeometryCache(geometry_cache_dir, geometry_version, geometry_cache_max_bytes)
+            drawing = StabDrawing(Path(file), 2000, 6000, project["name"], 2, stroke_width=3, geometry_cache=cache, compact_paths=True, precision=3)
+            bbox = drawing.get_bbox()
+            with tracing.span("scale"):
+                scale = get_scale_from_bbox(bbox, base_config["rectangle_size"])
+            drawing.notch_width = mm_per_pix*base_config["notch_size"]/scale
+
+            with tracing.span("svg_write"):
+                rocket_svg = drawing.render_svg().asSvg()
+            card_svg = compose_card(base_config, rocket_svg, bbox)
+            page = io.BytesIO()
+            drawing.draw(page, backend="pdf")
+
+            if keep_rocket:
+                rocket_path = Path("output_rockets")/f"{Path(file).stem}.svg"
+                with open(rocket_path, "w", encoding="utf-8") as f:
+                    f.write(rocket_svg)
+                with open(rocket_path.with_suffix(".json"), "w", encoding="utf-8") as f:
+                    json.dump(drawing.get_metadata(), f)
+    except Exception as e:
+        return e, file, None
+
+    return None, file, (card_svg, page.getvalue())
+
+# Puts (workbook path, project) in workbooks as stabtrajs are downloaded, or as found in cache/ without fetching,
+# then None. The fetch report is left in report for the main thread.
+def produce_workbooks(workbooks, fetch, report):
+    try:
+        if fetch:
+            produce_fetched_workbooks(workbooks, report)
+        else:
+            with open("cache/project_list.json", "r", encoding="utf-8") as f:
+                project_data = {project["id"]: project for project in json.load(f)["project_list"]}
+            for file in sorted(glob("cache/*.xlsx") + glob("cache/*.xls")):
+                if "_temp." in file: continue
+                workbooks.put((file, project_data[Path(file).name.split("_")[0]]))
+    except Exception as e:
+        report["error"] = e
+    finally:
+        workbooks.put(None)
+
+def produce_fetched_workbooks(workbooks, report):
+    import get_stabs
+    projects = get_stabs.get_projects()
+    manifest = get_stabs.load_manifest()
+    fetch_errors = dict()
+    fetch_results = list()
+    conversion_errors = list()
+    for result in get_stabs.fetch_projects(projects, manifest, fetch_errors):
+        fetch_results.append(result)
+        project, project_details, converter_args, entry, _ = result
+        if project_details is None or project_details == "Invalid campaign": continue
+        if converter_args is not None:
+            converted, from_path = get_stabs.convert_workbook(*converter_args)
+            if not converted:
+                conversion_errors.append(from_path)
+                fetch_results[-1] = get_stabs.conversion_failed(result, manifest)
+                continue
+        workbooks.put((entry["path"], project))
+
+    updated_stabs, missing_projects = get_stabs.save_fetch_results(projects, fetch_results, manifest)
+    report["print"] = lambda: get_stabs.print_fetch_report(fetch_results, updated_stabs, missing_projects, fetch_errors, manifest)
+    report["conversion_errors"] = conversion_errors
+
+# Packs cards as they are produced, one packer per platter group
+class PlatterPacker():
+
+    def __init__(self, config):
+        packing_config = config.get("packing", dict())
+        self.strategy, self.rotate = packing_config.get("strategy", "maxrects"), packing_config.get("rotate", False)
+        self.mix_types = packing_config.get("mix_types", False)
+        self.copies = {"minif": config["minif_copies"], "fusex": config["fusex_copies"]}
+        self.platter_size = get_platter_size(platter_dims)
+        self.packers = dict()
+        self.card_keys = dict()
+        self.cards = dict()
+
+    def add(self, card_key, card, rocket_type):
+        group = "mixed" if self.mix_types else rocket_type
+        if group not in self.packers:
+            self.packers[group] = packing.Packer(self.platter_size, self.strategy, self.rotate, margin_px)
+            self.card_keys[group] = list()
+
+        self.cards[card_key] = card
+        with tracing.span("packing", file=card_key):
+            for _ in range(self.copies[rocket_type]):
+                self.card_keys[group].append(card_key)
+                self.packers[group].add(len(self.card_keys[group]) - 1, (card.width, card.height))
+
+    def write(self, output_dir):
+        utilisations = dict()
+        for group in sorted(self.packers):
+            bins = self.packers[group].bins
+            write_platters(bins, self.card_keys[group], self.cards, self.platter_size, output_dir, prefix=group)
+            utilisations[group] = [platter_bin.utilisation for platter_bin in bins]
+        return utilisations
+
+def main():
+    with open("config.json", "r", encoding="utf-8") as f:
+        config = json.load(f)
+    pipeline_config = config.get("pipeline", dict())
+    keep_rockets, keep_cards = pipeline_config.get("keep_rockets", False), pipeline_config.get("keep_cards", False)
+    workers = worker_count(config)
+    max_pending = 2*workers
+
+    os.makedirs("errors", exist_ok=True)
+    os.makedirs("output_platters", exist_ok=True)
+    if keep_rockets: os.makedirs("output_rockets", exist_ok=True)
+    if keep_cards: os.makedirs("output_cards", exist_ok=True)
+
+    # Bounded so that downloads do not run far ahead of the drawing pool
+    workbooks = queue.Queue(maxsize=pipeline_config.get("queue_size", 8))
+    report = dict()
+    producer = threading.Thread(target=produce_workbooks, args=(workbooks, pipeline_config.get("fetch", True), report), daemon=True)
+    producer.start()
+
+    platters = PlatterPacker(config)
+    pages = dict()
+    errors = list()
+    progress_bar = tqdm(desc="Fusées traitées")
+    progress_bar.set_postfix({"errors": 0})
+    rocket_types = dict()
+
+    def handle(future):
+        (e, file, result), worker_spans = future.result()
+        tracing.add(worker_spans)
+        progress_bar.update(1)
+        if e is not None:
+            errors.append((file, e))
+            os.rename(file, Path("errors")/Path(file).name)
+            progress_bar.set_postfix({"errors": len(errors)})
+            return
+
+        card_svg, page = result
+        rocket_type = rocket_types[file]
+        card_key = f"{Path(file).stem}_{rocket_type}.svg"
+        if keep_cards:
+            with open(Path("output_cards")/card_key, "w", encoding="utf-8") as f:
+                f.write(card_svg)
+        platters.add(card_key, Card.from_string(card_svg), rocket_type)
+        pages[Path(file).stem] = page
+
+    base_paths = [base["path"] for base in config["bases"].values()]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(default_font_path, base_paths)) as pool:
+        pending = set()
+        while True:
+            item = workbooks.get()
+            if item is None: break
+            file, project = item
+            rocket_types[file] = project["type"]
+            pending.add(pool.submit(tracing.run, rocket_worker, file, project, config["bases"][project["type"]], keep_rockets))
+
+            # Finished rockets are packed right away, waiting only when too many are in flight
+            done, pending = wait(pending, timeout=None if len(pending) >= max_pending else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                handle(future)
+
+        for future in as_completed(pending):
+            handle(future)
+    progress_bar.close()
+    producer.join()
+    if "error" in report:
+        raise report["error"]
+
+    utilisations = platters.write("output_platters")
+    merger = PdfMerger()
+    for stem in sorted(pages):
+        merger.append(io.BytesIO(pages[stem]))
+    with open("output_rockets.pdf", "wb") as f:
+        merger.write(f)
+    merger.close()
+
+    if "print" in report:
+        report["print"]()
+    for from_path in report.get("conversion_errors", list()):
+        print(f" - Erreur de conversion: {Path(from_path).name}")
+    for file, e in errors:
+        print(f" - Erreur sur le fichier {Path(file).name}: ({type(e).__name__}) {e}")
+    for group, group_utilisations in utilisations.items():
+        for platter_number, utilisation in enumerate(group_utilisations):
+            print(f" - {group}_{platter_number}: {utilisation:.0%} utilisé")
+    print(f"Plateau(x) nécéssaires: {sum(len(group_utilisations) for group_utilisations in utilisations.values())}")
+    tracing.write()
+
+if __name__ == "__main__":
+    main()
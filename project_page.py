@@ -0,0 +1,76 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+import lxml.etree
+import lxml.html
+
+stabtraj_title = "StabTraj's"
+class_xpath = "contains(concat(' ', normalize-space(@class), ' '), ' {} ')"
+
+xpaths = {
+    "campaign": "//select[@id='project__campaign']//option[@selected]",
+    "project_name": "//input[@id='project__name']/@value",
+    "club_name": "//select[@id='project__club']//option[@selected]",
+    "rce3": f"//*[{class_xpath.format('border-rce3')}]",
+    "stabtraj_links": f"(//h3[. = \"{stabtraj_title}\"])[1]/..//a[@href]",
+    "stabtraj_filename": f".//*[{class_xpath.format('project-document-filename')}]",
+}
+stabtraj_id_regex = re.compile(r"=(\d+)$")
+
+class ProjectPageError(ValueError):
+    pass
+
+@dataclass
+class ProjectPage():
+    campaign: str
+    project_name: str
+    club_name: str
+    stabtraj_href: str
+    stabtraj_id: int
+    stabtraj_filename: str
+    rce3: Optional[str]
+
+def first(tree, name):
+    result = tree.xpath(xpaths[name])
+    if len(result) == 0:
+        raise ProjectPageError(f"Missing {name} on the project page")
+    return result[0]
+
+def element_text(element):
+    return element if isinstance(element, str) else element.text_content()
+
+# Only the few elements used by get_stabs are looked up, a ProjectPageError naming the missing one is raised
+# instead of the page being skipped. Returns None for projects of another campaign.
+def parse_project_page(html, campaign):
+    try:
+        tree = lxml.html.fromstring(html)
+    except lxml.etree.ParserError as e:
+        raise ProjectPageError(f"Unreadable project page ({e})") from e
+    page_campaign = element_text(first(tree, "campaign"))
+    if page_campaign != campaign:
+        return None
+
+    # The stabtraj with the highest document id is the last one uploaded
+    stabtrajs = list()
+    for link in tree.xpath(xpaths["stabtraj_links"]):
+        match = stabtraj_id_regex.search(link.get("href"))
+        if match is not None:
+            stabtrajs.append((int(match.group(1)), link))
+    if len(stabtrajs) == 0:
+        raise ProjectPageError("Missing stabtraj_links on the project page")
+    stabtraj_id, last_stab = max(stabtrajs, key=lambda stabtraj: stabtraj[0])
+
+    row = last_stab.getparent().getparent()
+    if row is None:
+        raise ProjectPageError("Missing stabtraj_filename on the project page")
+    rce3_messages = tree.xpath(xpaths["rce3"])
+
+    return ProjectPage(
+        campaign=page_campaign,
+        project_name=str(first(tree, "project_name")),
+        club_name=element_text(first(tree, "club_name")),
+        stabtraj_href=last_stab.get("href"),
+        stabtraj_id=stabtraj_id,
+        stabtraj_filename=element_text(first(row, "stabtraj_filename")),
+        rce3=element_text(rce3_messages[-1]) if len(rce3_messages) > 0 else None
+    )
@@ -1,22 +1,40 @@
-import os, shutil, glob
+import glob, io
+from itertools import repeat
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 from svglib.svglib import svg2rlg
 from reportlab.graphics import renderPDF
 from PyPDF2 import PdfMerger
+import tracing
 
-def bulk_convert(from_glob, output):
-    os.makedirs("temp", exist_ok=True)
-    for svg_file in glob.glob(from_glob):
-        drawing = svg2rlg(svg_file)
-        renderPDF.drawToFile(drawing, f"temp/{Path(svg_file).name}.pdf")
-        
+def convert_worker(svg_file):
+    try:
+        with tracing.span("pdf_conversion", file=Path(svg_file).name):
+            drawing = svg2rlg(svg_file)
+            if drawing is None:
+                raise ValueError("Invalid SVG")
+            return renderPDF.drawToString(drawing), None
+    except Exception as e:
+        return None, e
+
+def bulk_convert(from_glob, output, max_workers=None):
+    svg_files = sorted(glob.glob(from_glob))
+    errors = list()
     merger = PdfMerger()
-    for pdf_file in glob.glob("temp/*.pdf"):
-        merger.append(pdf_file)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        # map yields in input order, pages are appended as soon as the next one is ready
+        for svg_file, ((pdf_data, error), worker_spans) in zip(svg_files, pool.map(tracing.run, repeat(convert_worker), svg_files)):
+            tracing.add(worker_spans)
+            if error is not None:
+                errors.append((svg_file, error))
+                continue
+            merger.append(io.BytesIO(pdf_data))
 
-    merger.write(output)
+    with open(output, "wb") as f:
+        merger.write(f)
     merger.close()
-    shutil.rmtree("temp")
+    return errors
 
 if __name__ == "__main__":
-    bulk_convert("output_rockets/*.svg", "output.pdf")
\ No newline at end of file
+    for svg_file, error in bulk_convert("output_rockets/*.svg", "output.pdf"):
+        print(f" - Erreur sur le fichier {svg_file}: ({type(error).__name__}) {error}")
@@ -1,25 +1,110 @@
 import math
 import freetype
+import numpy as np
+from pathlib import Path
 
 import warnings
 warnings.simplefilter("ignore")
 import drawSvg as draw
+from reportlab.pdfgen.canvas import FILL_NON_ZERO
 
 load_flags = freetype.FT_LOAD_DEFAULT | freetype.FT_LOAD_NO_BITMAP
 
+# Faces and glyph outlines are shared by every Text of the process
+faces = dict()
+glyphs = dict()
+
+class Glyph():
+    __slots__ = ["cbox", "commands", "points", "definition"]
+
+    def __init__(self, cbox, commands, points, definition):
+        self.cbox = cbox
+        self.commands = commands
+        self.points = points
+        self.definition = definition
+
+def get_face(font_name):
+    if font_name not in faces:
+        face = freetype.Face(str(font_name))
+        face.set_pixel_sizes(2,2)
+        faces[font_name] = face
+    return faces[font_name]
+
+def get_glyph(font_name, letter):
+    key = (font_name, letter)
+    if key not in glyphs:
+        face = get_face(font_name)
+        face.load_char(letter, load_flags)
+        outline = face.glyph.outline
+        cbox = outline.get_cbox()
+        recorded = list()
+        outline.decompose(recorded, move_to=record_move_to, line_to=record_line_to, conic_to=record_conic_to, cubic_to=record_cubic_to)
+        
+        commands = [(command, len(points)) for command, points in recorded]
+        points = np.array([point for _, command_points in recorded for point in command_points], dtype=float).reshape(-1, 2)
+        
+        # Outline at font size 1, shared through <use> by every occurrence of the letter
+        definition = draw.Path(id=f"glyph-{Path(str(font_name)).stem}-{ord(letter):x}")
+        write_commands(definition, commands, points/64)
+        glyphs[key] = Glyph((cbox.xMin, cbox.yMin, cbox.xMax, cbox.yMax), commands, points, definition)
+    return glyphs[key]
+
+def write_commands(path, commands, points):
+    coords = points.ravel().tolist()
+    index = 0
+    for command, count in commands:
+        getattr(path, command)(*coords[index:index+2*count])
+        index += 2*count
+    return path
+
+def write_pdf_commands(path, commands, points):
+    index, current = 0, None
+    for command, count in commands:
+        command_points = points[index:index+count].tolist()
+        index += count
+        if command == "M":
+            if current is not None:
+                path.close()
+            path.moveTo(*command_points[0])
+        elif command == "L":
+            path.lineTo(*command_points[0])
+        elif command == "Q":
+            # PDF only has cubic curves
+            (cx, cy), (x, y) = command_points
+            path.curveTo(current[0] + 2/3*(cx - current[0]), current[1] + 2/3*(cy - current[1]), x + 2/3*(cx - x), y + 2/3*(cy - y), x, y)
+        else:
+            path.curveTo(*command_points[0], *command_points[1], *command_points[2])
+        current = command_points[-1]
+    if current is not None:
+        path.close()
+    return path
+
+def record_move_to(a, commands):
+    commands.append(("M", [(a.x, a.y)]))
+
+def record_line_to(a, commands):
+    commands.append(("L", [(a.x, a.y)]))
+
+def record_conic_to(a, b, commands):
+    commands.append(("Q", [(a.x, a.y), (b.x, b.y)]))
+
+def record_cubic_to(a, b, c, commands):
+    commands.append(("C", [(a.x, a.y), (b.x, b.y), (c.x, c.y)]))
+
 class Text():
     
-    def __init__(self, text, font_size, font_name, position, rotate_angle=0, rotate_origin=(0, 0), kern_margin=5, path_kwargs=None):
+    def __init__(self, text, font_size, font_name, position, rotate_angle=0, rotate_origin=(0, 0), kern_margin=5, path_kwargs=None, glyph_defs=True):
         self.text = text
         self.font_size = font_size
         self.scale = 64/self.font_size
-        self.font = freetype.Face(font_name)
-        self.font.set_pixel_sizes(2,2)
+        self.font_name = font_name
+        self.font = get_face(font_name)
         
         self.offset = list(position)
         self.rotate_angle = math.radians(rotate_angle)
         self.rotate_origin = rotate_origin
         self.kern_margin = kern_margin
+        self.glyph_defs = glyph_defs
         
         if path_kwargs is None:
             self.path_kwargs = dict(stroke_width=2, stroke=None, fill='black')
@@ -30,14 +115,29 @@ class Text():
         self.font_size = font_size
         self.scale = 64/self.font_size
     
-    def draw(self, drawing):
+    def letter_offsets(self):
+        offset = self.offset[0]
         for letter in self.text:
             if letter == " ":
-                self.offset[0] += self.font_size
+                offset += self.font_size
             else:
-                drawing.append(self.draw_letter(letter))
-                cbox = self.font.glyph.outline.get_cbox()
-                self.offset[0] += cbox.xMax/self.scale + self.kern_margin
+                yield letter, offset
+                offset += get_glyph(self.font_name, letter).cbox[2]/self.scale + self.kern_margin
+    
+    def draw(self, drawing):
+        start_x = self.offset[0]
+        for letter, self.offset[0] in self.letter_offsets():
+            drawing.append(self.draw_letter(letter))
+        self.offset[0] = start_x
+    
+    def draw_pdf(self, canvas):
+        start_x = self.offset[0]
+        path = canvas.beginPath()
+        for letter, self.offset[0] in self.letter_offsets():
+            glyph = get_glyph(self.font_name, letter)
+            write_pdf_commands(path, glyph.commands, self.transform_points(glyph.points))
+        self.offset[0] = start_x
+        canvas.drawPath(path, stroke=0, fill=1, fillMode=FILL_NON_ZERO)
                 
     def get_bbox(self):
         bboxes = list()
@@ -46,10 +146,9 @@ class Text():
             if letter == " ":
                 offset += self.font_size
             else:
-                self.font.load_char(letter, load_flags)
-                cbox = self.font.glyph.outline.get_cbox()
-                bboxes.append([cbox.xMin/self.scale+offset, cbox.yMin/self.scale, cbox.xMax/self.scale+offset, cbox.yMax/self.scale])
-                offset += cbox.xMax/self.scale + self.kern_margin
+                cbox = get_glyph(self.font_name, letter).cbox
+                bboxes.append([cbox[0]/self.scale+offset, cbox[1]/self.scale, cbox[2]/self.scale+offset, cbox[3]/self.scale])
+                offset += cbox[2]/self.scale + self.kern_margin
         
         output = list()
         for i in range(4):
@@ -60,35 +159,69 @@ class Text():
             output.append(f(bbox[i] for bbox in bboxes))
         return output
         
+    def fit_to_box(self, width, height, max_font_size=None):
+        # Every glyph edge is at a*font_size + b, b coming from the fixed kern margins, so the
+        # largest font size fitting the box is solved directly from each pair of edges
+        if max_font_size is None:
+            max_font_size = self.font_size
+        
+        mins, maxs, y_mins, y_maxs = list(), list(), list(), list()
+        a, b = 0, 0
+        for letter in self.text:
+            if letter == " ":
+                a += 1
+            else:
+                cbox = get_glyph(self.font_name, letter).cbox
+                mins.append((a + cbox[0]/64, b))
+                maxs.append((a + cbox[2]/64, b))
+                y_mins.append(cbox[1]/64)
+                y_maxs.append(cbox[3]/64)
+                a += cbox[2]/64
+                b += self.kern_margin
+        
+        font_sizes = [max_font_size]
+        if max(y_maxs) - min(y_mins) > 0:
+            font_sizes.append(height/(max(y_maxs) - min(y_mins)))
+        for a_max, b_max in maxs:
+            for a_min, b_min in mins:
+                if a_max - a_min > 0:
+                    font_sizes.append((width - (b_max - b_min))/(a_max - a_min))
+                elif b_max - b_min > width:
+                    raise ValueError(f"\"{self.text}\" can't fit in {width}x{height}")
+        
+        font_size = min(font_sizes)
+        if font_size <= 0:
+            raise ValueError(f"\"{self.text}\" can't fit in {width}x{height}")
+        self.set_font_size(font_size)
+        return font_size
+        
+    def get_transformed_bbox(self):
+        xmin, ymin, xmax, ymax = self.get_bbox()
+        corners = [self.rotate_point((x+self.offset[0], y+self.offset[1])) for x in (xmin, xmax) for y in (ymin, ymax)]
+        xs, ys = [corner[0] for corner in corners], [corner[1] for corner in corners]
+        return [min(xs), min(ys), max(xs), max(ys)]
+        
     def draw_letter(self, letter):
-        p = draw.Path(**self.path_kwargs)
-        self.font.load_char(letter, load_flags)
-        self.font.glyph.outline.decompose(p, move_to=self.move_to, line_to=self.line_to, conic_to=self.conic_to, cubic_to=self.cubic_to)
-        return p
+        glyph = get_glyph(self.font_name, letter)
+        if self.glyph_defs:
+            return draw.Use(glyph.definition, 0, 0, transform=self.letter_transform(), **self.path_kwargs)
+        return write_commands(draw.Path(**self.path_kwargs), glyph.commands, self.transform_points(glyph.points))
     
-    def move_to(self, a, ctx):
-        points = self.transform_points([a])
-        ctx.M(*self.reduce_points(points))
-
-    def line_to(self, a, ctx):
-        points = self.transform_points([a])
-        ctx.L(*self.reduce_points(points))
-
-    def conic_to(self, a, b, ctx):
-        points = self.transform_points([a, b])
-        ctx.Q(*self.reduce_points(points))
-
-    def cubic_to(self, a, b, c, ctx):
-        points = self.transform_points([a, b, c])
-        ctx.C(*self.reduce_points(points))
+    def letter_transform(self):
+        # Maps the font size 1 glyph to its place, in SVG coordinates (y axis pointing down)
+        cos, sin = math.cos(self.rotate_angle), math.sin(self.rotate_angle)
+        x, y = self.rotate_point(self.offset)
+        return f"matrix({self.font_size*cos} {-self.font_size*sin} {self.font_size*sin} {self.font_size*cos} {x} {-y})"
         
     def transform_points(self, points):
-        output = list()
-        for point in points:
-            point = (point.x/self.scale+self.offset[0], point.y/self.scale+self.offset[1])
-            point = self.rotate_point(point)
-            output.append([point[0], point[1]])
-        return output
+        points = np.asarray(points, dtype=float)/self.scale + self.offset
+        return self.rotate_points(points)
+    
+    def rotate_points(self, points):
+        cos, sin = math.cos(self.rotate_angle), math.sin(self.rotate_angle)
+        origin = np.asarray(self.rotate_origin, dtype=float)
+        relative = points - origin
+        return np.column_stack((cos*relative[:, 0] - sin*relative[:, 1], sin*relative[:, 0] + cos*relative[:, 1])) + origin
     
     def rotate_point(self, point):
         ox, oy = self.rotate_origin
@@ -96,6 +229,3 @@ class Text():
         qx = ox + math.cos(self.rotate_angle) * (px - ox) - math.sin(self.rotate_angle) * (py - oy)
         qy = oy + math.sin(self.rotate_angle) * (px - ox) + math.cos(self.rotate_angle) * (py - oy)
         return (qx, qy)
-    
-    def reduce_points(self, points):
-        return [coord for point in points for coord in point]
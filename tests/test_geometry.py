@@ -0,0 +1,38 @@
+import numpy as np
+from geometry import chain_segments, clean_series, outline_segments
+
+def test_clean_series_drops_non_finite_rows():
+    series = {"fuselage": [[0, 0], [np.nan, 1], [1, np.nan], [1, 1], [1, 1], [2, 0]], "aileron": [[np.nan, np.nan], [np.inf, 0]]}
+    cleaned = clean_series(series)
+    assert list(cleaned) == ["fuselage"]
+    assert cleaned["fuselage"].tolist() == [[0, 0], [1, 1], [2, 0]]
+
+def reference_segments(outline, base_points):
+    # Loop of the original StabDrawing.draw
+    def distance(a, b):
+        return ((a[0] - b[0])**2 + (a[1] - b[1])**2)**0.5
+    lines = list()
+    for i in range(1, len(outline)-1):
+        if outline[i-1] in base_points and outline[i] in base_points: continue
+        if outline[i-1][1] == outline[i][1] == base_points[0][1]:
+            lines.append([outline[i-1], min(base_points, key=lambda x: distance(outline[i-1], x))])
+            lines.append([min(base_points, key=lambda x: distance(outline[i], x)), outline[i]])
+        else:
+            lines.append([outline[i-1], outline[i]])
+    lines.append([lines[-1][1], lines[0][0]])
+    return lines
+
+def test_outline_segments():
+    outline = [[0, 0], [10, -20], [10, -90], [30, -100], [12, -100], [8, -100], [-8, -100], [-12, -100], [-30, -100], [-10, -90], [-10, -20], [0, 0]]
+    base_points = [[8, -100], [-8, -100]]
+    assert outline_segments(outline, base_points).tolist() == reference_segments(outline, base_points)
+
+def test_chain_segments():
+    segments = [[[0, 0], [1, 0]], [[1, 0], [1, 1]], [[5, 5], [6, 6]], [[6, 6], [0, 0]]]
+    polylines = chain_segments(segments)
+    # The last polyline ends where the first starts, they are joined
+    assert [polyline.tolist() for polyline in polylines] == [[[5, 5], [6, 6], [0, 0], [1, 0], [1, 1]]]
+
+    polylines = chain_segments([[[0, 0], [1.0004, 0]], [[1.0001, 0], [2, 2]], [[3, 3], [4, 4]]], precision=3)
+    assert [polyline.tolist() for polyline in polylines] == [[[0, 0], [1, 0], [2, 2]], [[3, 3], [4, 4]]]
+    assert chain_segments([]) == []
@@ -0,0 +1,76 @@
+import importlib, json, shutil, sys, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import pytest
+
+fixtures = Path(__file__).resolve().parent.parent/"benchmarks"/"fixtures"
+workbook_data = b"stabtraj v1"
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    hits = list()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if "edit_project" in self.path:
+            body, etag = (fixtures/"project_page.html").read_bytes(), '"page-v1"'
+        else:
+            body, etag = workbook_data, '"file-v1"'
+        self.hits.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def get_stabs(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Handler.hits.clear()
+    config = {"api_key": "", "cookies": "", "campaign": "C'Space", "launch_year": 2022, "base_url": f"http://127.0.0.1:{server.server_port}",
+              "excel_conversion": False, "requests_per_second": 0, "fetch_retries": 0}
+    (tmp_path/"config.json").write_text(json.dumps(config), encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    sys.modules.pop("get_stabs", None)
+    yield importlib.import_module("get_stabs")
+    sys.modules.pop("get_stabs", None)
+    server.shutdown()
+
+def test_not_modified_page_with_missing_workbook(get_stabs):
+    first_details, _, entry, status = get_stabs.get_project_details("42")
+    assert status == "new" and Path(entry["path"]).read_bytes() == workbook_data
+
+    _, _, entry, status = get_stabs.get_project_details("42", entry)
+    assert status == "unchanged"
+
+    # As draw.main does with a workbook it could not draw
+    shutil.move(entry["path"], Path("errors")/Path(entry["path"]).name)
+    Handler.hits.clear()
+    details, _, entry, _ = get_stabs.get_project_details("42", entry)
+    assert details == first_details
+    assert Path(entry["path"]).read_bytes() == workbook_data
+    assert [if_none_match for path, if_none_match in Handler.hits if "edit_project" in path] == ['"page-v1"', None]
+
+def test_same_stabtraj_under_a_new_file_name(get_stabs):
+    _, _, entry, _ = get_stabs.get_project_details("42")
+    new_path = Path(entry["path"])
+    old_path = new_path.with_name("42_old.xlsx")
+    new_path.rename(old_path)
+    # Recorded before the file was renamed on the project page
+    entry["path"], entry["page"] = str(old_path), None
+
+    _, _, entry, status = get_stabs.get_project_details("42", entry)
+    assert status == "unchanged"
+    assert entry["path"] == str(new_path) and new_path.read_bytes() == workbook_data and not old_path.exists()
+
+    Handler.hits.clear()
+    _, _, entry, status = get_stabs.get_project_details("42", entry)
+    assert status == "unchanged" and len(Handler.hits) == 1
@@ -0,0 +1,29 @@
+import sys
+from pathlib import Path
+import drawSvg as draw
+import pytest
+import merger
+from svg_text import Text
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent/"benchmarks"))
+from generate_stabtraj import stabtraj_series, write_stabtraj
+
+font_path = str(Path(__file__).resolve().parent.parent/"fonts"/"nasalization-rg.otf")
+# The font is not distributed with the repository
+pytestmark = pytest.mark.skipif(not Path(font_path).exists(), reason="fonts/nasalization-rg.otf is missing")
+
+def test_svg_bbox_places_glyph_definitions(tmp_path):
+    bboxes = list()
+    for glyph_defs in [True, False]:
+        drawing = draw.Drawing(400, 400, origin=(0, 0))
+        Text("ROCKET", 40, font_path, (20, 150), rotate_angle=90, rotate_origin=(20, 150), glyph_defs=glyph_defs).draw(drawing)
+        drawing.saveSvg(tmp_path/f"text_{glyph_defs}.svg")
+        bboxes.append(merger.svg_bbox(tmp_path/f"text_{glyph_defs}.svg"))
+    assert bboxes[0] == pytest.approx(bboxes[1])
+
+def test_svg_bbox_matches_rocket_geometry(tmp_path):
+    import draw as stab_draw
+    write_stabtraj(tmp_path/"1_stab.xlsx", stabtraj_series())
+    drawing = stab_draw.StabDrawing(tmp_path/"1_stab.xlsx", 2000, 6000, "ROCKET", 2, font_path=font_path, stroke_width=3)
+    drawing.draw(tmp_path/"1_stab.svg")
+    assert merger.svg_bbox(tmp_path/"1_stab.svg") == pytest.approx(drawing.get_bbox())
@@ -0,0 +1,52 @@
+import random
+import pytest
+from packing import pack, strategies
+
+bin_size = (600, 300)
+margin = 1.5
+
+def random_sizes(count, seed=0):
+    generator = random.Random(seed)
+    return [(generator.uniform(20, 250), generator.uniform(20, 140)) for _ in range(count)]
+
+def placed_rects(bins, sizes):
+    for bin_index, packing_bin in enumerate(bins):
+        for index, x, y, rotated in packing_bin.placements:
+            width, height = sizes[index][::-1] if rotated else sizes[index]
+            yield bin_index, index, (x, y, width, height), rotated
+
+@pytest.mark.parametrize("strategy", list(strategies))
+@pytest.mark.parametrize("rotate", [False, True])
+def test_pack(strategy, rotate):
+    sizes = random_sizes(60)
+    bins = pack(sizes, bin_size, strategy, rotate, margin)
+    rects = list(placed_rects(bins, sizes))
+    assert sorted(index for _, index, _, _ in rects) == list(range(len(sizes)))
+
+    for bin_index, index, (x, y, width, height), rotated in rects:
+        assert rotate or not rotated
+        assert x >= -1e-9 and y >= -1e-9 and x + width <= bin_size[0] + 1e-9 and y + height <= bin_size[1] + 1e-9
+        # Items are at least margin apart
+        for other_bin, other_index, (other_x, other_y, other_width, other_height), _ in rects:
+            if other_bin != bin_index or other_index == index: continue
+            assert (x + width + margin <= other_x + 1e-9 or other_x + other_width + margin <= x + 1e-9
+                    or y + height + margin <= other_y + 1e-9 or other_y + other_height + margin <= y + 1e-9)
+
+    for packing_bin in bins:
+        used_area = sum(sizes[index][0]*sizes[index][1] for index, *_ in packing_bin.placements)
+        assert packing_bin.utilisation == pytest.approx(used_area/(bin_size[0]*bin_size[1]))
+
+@pytest.mark.parametrize("strategy", list(strategies))
+def test_rotation(strategy):
+    sizes = [(100, 500)]
+    with pytest.raises(ValueError):
+        pack(sizes, bin_size, strategy, rotate=False)
+    (packing_bin,) = pack(sizes, bin_size, strategy, rotate=True)
+    assert packing_bin.placements[0][3] is True
+
+@pytest.mark.parametrize("strategy", list(strategies))
+def test_oversize(strategy):
+    with pytest.raises(ValueError):
+        pack([(50, 50), (700, 50)], bin_size, strategy, rotate=True, margin=margin)
+    # The margin is only kept between items, an item can fill the bin
+    assert len(pack([bin_size], bin_size, strategy, margin=margin)) == 1
@@ -0,0 +1,19 @@
+from pathlib import Path
+import pytest
+from project_page import parse_project_page, ProjectPageError
+
+fixtures = Path(__file__).resolve().parent.parent/"benchmarks"/"fixtures"
+campaign = "C'Space"
+
+def test_project_page():
+    page = parse_project_page((fixtures/"project_page.html").read_text(encoding="utf-8"), campaign)
+    assert page.campaign == campaign
+    assert page.stabtraj_href.endswith(f"id={page.stabtraj_id}")
+
+def test_other_campaign():
+    assert parse_project_page((fixtures/"project_page_other_campaign.html").read_text(encoding="utf-8"), campaign) is None
+
+@pytest.mark.parametrize("html", ["", "   ", "<html></html>"])
+def test_empty_document(html):
+    with pytest.raises(ProjectPageError):
+        parse_project_page(html, campaign)
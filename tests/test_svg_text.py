@@ -0,0 +1,26 @@
+from pathlib import Path
+import pytest
+from svg_text import Text
+
+font_path = str(Path(__file__).resolve().parent.parent/"fonts"/"nasalization-rg.otf")
+# The font is not distributed with the repository
+pytestmark = pytest.mark.skipif(not Path(font_path).exists(), reason="fonts/nasalization-rg.otf is missing")
+
+@pytest.mark.parametrize("text, width, height", [("ROCKET", 400, 80), ("ROCKET", 4000, 80), ("A B-1", 120, 500), ("I", 50, 50)])
+def test_fit_to_box(text, width, height):
+    label = Text(text, 1000, font_path, (0, 0))
+    font_size = label.fit_to_box(width, height)
+    xmin, ymin, xmax, ymax = label.get_bbox()
+    assert xmax - xmin <= width + 1e-6 and ymax - ymin <= height + 1e-6
+    # The limiting dimension is filled
+    assert max((xmax - xmin)/width, (ymax - ymin)/height) == pytest.approx(1)
+    assert label.font_size == font_size
+
+def test_fit_to_box_max_font_size():
+    label = Text("ROCKET", 10, font_path, (0, 0))
+    assert label.fit_to_box(4000, 4000) == 10
+
+def test_fit_to_box_too_narrow():
+    label = Text("ROCKET", 10, font_path, (0, 0), kern_margin=5)
+    with pytest.raises(ValueError):
+        label.fit_to_box(20, 100)
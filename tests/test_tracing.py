@@ -0,0 +1,13 @@
+import json
+import tracing
+
+def test_chrome_traces_are_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing, "enabled", True)
+    path = tmp_path/"trace.json"
+    for name in ["get_stabs", "draw"]:
+        with tracing.span(name):
+            pass
+        tracing.write(path)
+
+    with open(path, encoding="utf-8") as f:
+        assert [event["name"] for event in json.load(f)["traceEvents"]] == ["get_stabs", "draw"]
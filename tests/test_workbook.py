@@ -0,0 +1,48 @@
+import re, struct, sys, zipfile
+from pathlib import Path
+import numpy as np
+from workbook import read_records, read_chart_series, read_chart_series_xml, parse_chart_records, record_ai, record_continue, record_eof, record_series
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent/"benchmarks"))
+from generate_stabtraj import stabtraj_series, write_stabtraj
+
+def biff_record(code, data):
+    return struct.pack("<HH", code, len(data)) + data
+
+def ai_record(link_id, formula):
+    return struct.pack("<BBHHH", link_id, 2, 0, 0, len(formula)) + formula
+
+def area3d(min_row, max_row, col):
+    return struct.pack("<BHHHHH", 0x3B, 0, min_row, max_row, col, col)
+
+def test_continue_records_are_joined():
+    values = ai_record(1, area3d(99, 159, 2))
+    data = (biff_record(record_series, b"\0"*12) + biff_record(record_ai, ai_record(2, area3d(99, 159, 1)))
+            + biff_record(record_ai, values[:6]) + biff_record(record_continue, values[6:]) + biff_record(record_eof, b""))
+    assert parse_chart_records(read_records(data, 0)) == [(None, (0, 99, 159, 1, 1), (0, 99, 159, 2, 2))]
+
+def write_without_references(path, output):
+    # Same workbook without the optional r attributes of the cells following another one
+    with zipfile.ZipFile(path) as source, zipfile.ZipFile(output, "w") as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename.startswith("xl/worksheets/sheet"):
+                data = re.sub(rb'(</c><c[^>]*?) r="[A-Z]+\d+"', rb"\1", data)
+            target.writestr(item, data)
+
+def test_cells_without_references(tmp_path):
+    write_stabtraj(tmp_path/"stab.xlsx", stabtraj_series())
+    write_without_references(tmp_path/"stab.xlsx", tmp_path/"stab_no_r.xlsx")
+    expected = read_chart_series_xml(tmp_path/"stab.xlsx")
+    series = read_chart_series_xml(tmp_path/"stab_no_r.xlsx")
+    assert [title for title, *_ in series] == [title for title, *_ in expected]
+    for (_, x_values, y_values), (_, expected_x, expected_y) in zip(series, expected):
+        assert np.array_equal(x_values, expected_x, equal_nan=True) and np.array_equal(y_values, expected_y, equal_nan=True)
+
+def test_xls_workbook():
+    # BIFF8 workbook holding stabtraj_series() on the Stabilito sheet and its scatter chart
+    series = read_chart_series(Path(__file__).resolve().parent/"fixtures"/"stabtraj.xls")
+    expected = stabtraj_series()
+    assert [title for title, *_ in series] == list(expected)
+    for title, x_values, y_values in series:
+        assert np.column_stack((x_values, y_values)).tolist() == [list(point) for point in expected[title]]
@@ -0,0 +1,75 @@
+import json, os, threading, time
+from contextlib import contextmanager
+
+# Opt-in with STABTRAJ_TRACE=trace.json (Chrome trace, opened in chrome://tracing or Perfetto) or trace.jsonl (one span per line).
+# Pool workers inherit the variable, their spans are sent back with tracing.run.
+trace_path = os.environ.get("STABTRAJ_TRACE")
+enabled = bool(trace_path)
+
+spans = list()
+local = threading.local()
+
+@contextmanager
+def span(name, **args):
+    if not enabled:
+        yield
+        return
+
+    # Nested spans are attributed to the file of the enclosing one
+    stack = local.__dict__.setdefault("stack", list())
+    if "file" not in args and len(stack) > 0 and "file" in stack[-1]:
+        args["file"] = stack[-1]["file"]
+    args = {key: str(value) for key, value in args.items()}
+    stack.append(args)
+
+    timestamp = time.time_ns()
+    start, cpu_start = time.perf_counter_ns(), time.thread_time_ns()
+    try:
+        yield
+    finally:
+        duration, cpu_duration = time.perf_counter_ns() - start, time.thread_time_ns() - cpu_start
+        stack.pop()
+        spans.append({
+            "name": name,
+            "ph": "X",
+            "ts": timestamp/1000,
+            "dur": duration/1000,
+            "pid": os.getpid(),
+            "tid": threading.get_native_id(),
+            "args": {**args, "cpu_ms": cpu_duration/1e6},
+        })
+
+def collect():
+    collected = spans[:]
+    del spans[:len(collected)]
+    return collected
+
+def add(worker_spans):
+    spans.extend(worker_spans)
+
+# Runs func in a pool worker, returning (result, spans of the call) so that the parent can add them.
+# Forked workers start with a copy of the parent spans, only the ones recorded by the call are returned.
+def run(func, *args, **kwargs):
+    first = len(spans)
+    result = func(*args, **kwargs)
+    call_spans = spans[first:]
+    del spans[first:]
+    return result, call_spans
+
+def write(path=None):
+    path = path or trace_path
+    if not enabled or not path: return
+    events = collect()
+    if str(path).endswith(".jsonl"):
+        with open(path, "a", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+    else:
+        # The scripts of a get_stabs, draw, merger run add their events to the same trace
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                events = json.load(f)["traceEvents"] + events
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
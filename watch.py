@@ -0,0 +1,206 @@
+import hashlib, io, json, os, time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from pathlib import Path
+from PyPDF2 import PdfMerger
+import packing
+import tracing
+from draw import default_font_path, init_worker, worker_count
+from merger import Card, get_platter_size, write_platters, margin_px, platter_dims
+from pipeline import rocket_worker
+
+# Long running version of draw.py + merger.py: workbooks, config.json and the project list are polled,
+# only the rockets whose workbook, project or base changed are drawn again and only the platters whose cards moved are written.
+# With STABTRAJ_TRACE, prefer a .jsonl trace as the spans are written after each update.
+
+project_list_path = "cache/project_list.json"
+
+def signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def watched_files():
+    workbooks = [file for file in glob("cache/*.xlsx") + glob("cache/*.xls") if not "_temp." in file]
+    return workbooks + ["config.json", project_list_path]
+
+def load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+class Watcher():
+
+    def __init__(self, pool, config, projects):
+        self.pool = pool
+        self.config = config
+        self.projects = projects
+        self.signatures = dict()
+        self.settling = dict()
+        self.rockets = dict() # workbook -> (card key, rocket type)
+        self.cards = dict() # card key -> (Card, digest of the card SVG)
+        self.pages = dict()
+        self.platters = dict() # group -> placements of each platter
+
+    def poll(self):
+        seen = {path: signature(path) for path in watched_files()}
+        for path in self.signatures:
+            seen.setdefault(path, None)
+
+        changed = set()
+        for path, path_signature in seen.items():
+            if path_signature == self.signatures.get(path):
+                self.settling.pop(path, None)
+            # Files are only read once unchanged for a whole interval, uploads and conversions being written in several steps
+            elif path in self.settling and self.settling[path] == path_signature:
+                changed.add(path)
+            else:
+                self.settling[path] = path_signature
+        return changed
+
+    def group(self, rocket_type):
+        return "mixed" if self.config.get("packing", dict()).get("mix_types", False) else rocket_type
+
+    def project(self, file):
+        return self.projects.get(Path(file).name.split("_")[0])
+
+    def update(self, changed):
+        for path in changed:
+            path_signature = self.settling.pop(path)
+            if path_signature is None:
+                self.signatures.pop(path, None)
+            else:
+                self.signatures[path] = path_signature
+
+        redraw = changed - {"config.json", project_list_path}
+        repack_all = False
+        workbooks = [path for path in self.signatures if path not in ["config.json", project_list_path]]
+        if "config.json" in changed:
+            config = load_json("config.json")
+            for rocket_type, base in config["bases"].items():
+                if self.config["bases"].get(rocket_type) != base:
+                    redraw.update(file for file in workbooks if (self.project(file) or dict()).get("type") == rocket_type)
+            repack_all = any(config.get(key) != self.config.get(key) for key in ["packing", "minif_copies", "fusex_copies"])
+            self.config = config
+        if project_list_path in changed:
+            projects = {project["id"]: project for project in load_json(project_list_path)["project_list"]}
+            redraw.update(file for file in workbooks if projects.get(Path(file).name.split("_")[0]) != self.project(file))
+            self.projects = projects
+
+        dirty_groups = set()
+        futures = dict()
+        for file in sorted(redraw):
+            if file in self.rockets:
+                dirty_groups.add(self.group(self.remove(file)))
+            if file not in self.signatures: continue
+            project = self.project(file)
+            if project is None:
+                print(f" - Projet inconnu pour le fichier {Path(file).name}")
+                continue
+            futures[self.pool.submit(tracing.run, rocket_worker, file, project, self.config["bases"][project["type"]], True)] = project["type"]
+
+        for future in as_completed(futures):
+            (e, file, result), worker_spans = future.result()
+            tracing.add(worker_spans)
+            if e is not None:
+                print(f" - Erreur sur le fichier {Path(file).name}: ({type(e).__name__}) {e}")
+                os.rename(file, Path("errors")/Path(file).name)
+                self.signatures.pop(file, None)
+                continue
+
+            card_svg, page = result
+            rocket_type = futures[future]
+            card_key = f"{Path(file).stem}_{rocket_type}.svg"
+            with open(Path("output_cards")/card_key, "w", encoding="utf-8") as f:
+                f.write(card_svg)
+            self.cards[card_key] = Card.from_string(card_svg), hashlib.sha1(card_svg.encode()).hexdigest()
+            self.rockets[file] = card_key, rocket_type
+            self.pages[Path(file).stem] = page
+            dirty_groups.add(self.group(rocket_type))
+
+        groups = self.group_cards()
+        written = 0
+        for group in sorted(set(groups) | set(self.platters)):
+            if repack_all or group in dirty_groups:
+                written += self.repack(group, groups.get(group, list()))
+
+        if len(redraw) > 0:
+            self.write_pages()
+        return len(futures), written
+
+    # Returns the type of the removed rocket
+    def remove(self, file):
+        card_key, rocket_type = self.rockets.pop(file)
+        del self.cards[card_key]
+        self.pages.pop(Path(file).stem, None)
+        Path("output_cards", card_key).unlink(missing_ok=True)
+        if file not in self.signatures:
+            rocket_path = Path("output_rockets")/f"{Path(file).stem}.svg"
+            rocket_path.unlink(missing_ok=True)
+            rocket_path.with_suffix(".json").unlink(missing_ok=True)
+        return rocket_type
+
+    # Same card order as merger.main so that the platters are the same as a full run
+    def group_cards(self):
+        groups = dict()
+        for rocket_type in ["fusex", "minif"]:
+            card_keys = sorted([card_key for card_key, key_type in self.rockets.values() if key_type == rocket_type]*self.config[f"{rocket_type}_copies"])
+            if len(card_keys) > 0:
+                groups.setdefault(self.group(rocket_type), list()).extend(card_keys)
+        return groups
+
+    # Packs the group again and writes the platters whose placements or cards changed, returns their count
+    def repack(self, group, card_keys):
+        packing_config = self.config.get("packing", dict())
+        platter_size = get_platter_size(platter_dims)
+        with tracing.span("packing", platters=group):
+            bins = packing.pack([(self.cards[card_key][0].width, self.cards[card_key][0].height) for card_key in card_keys], platter_size,
+                                packing_config.get("strategy", "maxrects"), packing_config.get("rotate", False), margin_px)
+
+        platters = [sorted((card_keys[index], self.cards[card_keys[index]][1], x, y, rotated) for index, x, y, rotated in platter_bin.placements) for platter_bin in bins]
+        previous = self.platters.get(group, list())
+        platter_numbers = {number for number, platter in enumerate(platters) if number >= len(previous) or previous[number] != platter}
+        write_platters(bins, card_keys, {card_key: self.cards[card_key][0] for card_key in card_keys}, platter_size, "output_platters", prefix=group, platter_numbers=platter_numbers)
+
+        for path in glob(f"output_platters/{group}_*.svg"):
+            number = Path(path).stem[len(group) + 1:]
+            if number.isdigit() and int(number) >= len(bins):
+                os.remove(path)
+        self.platters[group] = platters
+        return len(platter_numbers)
+
+    def write_pages(self):
+        merger = PdfMerger()
+        for stem in sorted(self.pages):
+            merger.append(io.BytesIO(self.pages[stem]))
+        with open("output_rockets.pdf", "wb") as f:
+            merger.write(f)
+        merger.close()
+
+def main():
+    config = load_json("config.json")
+    interval = config.get("watch", dict()).get("interval", 1)
+    for folder in ["errors", "output_rockets", "output_cards", "output_platters"]:
+        os.makedirs(folder, exist_ok=True)
+
+    base_paths = [base["path"] for base in config["bases"].values()]
+    with ProcessPoolExecutor(max_workers=worker_count(config), initializer=init_worker, initargs=(default_font_path, base_paths)) as pool:
+        projects = {project["id"]: project for project in load_json(project_list_path)["project_list"]}
+        watcher = Watcher(pool, config, projects)
+        print("Surveillance de cache/ et config.json (Ctrl+C pour arrêter)")
+        try:
+            while True:
+                changed = watcher.poll()
+                if len(changed) > 0:
+                    start = time.perf_counter()
+                    with tracing.span("watch_update", files=len(changed)):
+                        rockets, platters = watcher.update(changed)
+                    print(f"[{time.strftime('%H:%M:%S')}] {len(changed)} fichier(s) modifié(s): {rockets} fusée(s) et {platters} plateau(x) en {time.perf_counter() - start:.2f} s")
+                    tracing.write()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import re
+import numpy as np
+import posixpath
+import struct
+import zipfile
+import xml.etree.ElementTree as ET
+
+range_regex = re.compile(r"!\$([A-Z]+)\$(\d+):\$([A-Z]+)\$(\d+)")
+cell_regex = re.compile(r"([A-Z]+)(\d+)")
+
+sheet_names = ["Stabilito", "stabilito"]
+
+ns = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "xdr": "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing",
+    "c": "http://schemas.openxmlformats.org/drawingml/2006/chart",
+}
+chart_rel_type = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/chart"
+drawing_rel_type = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/drawing"
+chart_tags = ["scatterChart", "lineChart", "areaChart", "barChart", "bubbleChart", "radarChart", "pieChart", "doughnutChart", "surfaceChart", "stockChart"]
+
+# Returns the series of the first Stabilito chart as (title, x_values, y_values) with float arrays, title being None
+# when the serie has no title element. Only the chart and the referenced cells are parsed, openpyxl
+# is used as a fallback for workbooks this reader does not understand. Legacy .xls workbooks are read with xlrd.
+def read_chart_series(path):
+    if str(path).lower().endswith(".xls"):
+        return read_chart_series_xls(path)
+    try:
+        return read_chart_series_xml(path)
+    except (KeyError, IndexError, ValueError, AttributeError, StopIteration, zipfile.BadZipFile, ET.ParseError):
+        return read_chart_series_openpyxl(path)
+
+def read_chart_series_xml(path):
+    with zipfile.ZipFile(path) as archive:
+        sheet_path = find_sheet_path(archive)
+        drawing_path = get_relations(archive, sheet_path, drawing_rel_type)[0]
+        chart_path = find_first_chart(archive, drawing_path)
+        series = parse_chart(archive.read(chart_path))
+
+        ranges = [cell_range for _, x_range, y_range in series for cell_range in (x_range, y_range)]
+        values = read_ranges(archive.open(sheet_path), ranges)
+
+    return [(title, values[x_range], values[y_range]) for title, x_range, y_range in series]
+
+def find_sheet_path(archive):
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    relations = read_relations(archive, "xl/workbook.xml")
+    sheets = {sheet.get("name"): sheet.get(f"{{{ns['r']}}}id") for sheet in workbook.iterfind("main:sheets/main:sheet", ns)}
+    for sheet_name in sheet_names:
+        if sheet_name in sheets:
+            return relations[sheets[sheet_name]][1]
+    raise KeyError("Stabilito sheet not found")
+
+def rels_path(part_path):
+    folder, name = posixpath.split(part_path)
+    return posixpath.join(folder, "_rels", f"{name}.rels")
+
+def read_relations(archive, part_path):
+    relations = dict()
+    root = ET.fromstring(archive.read(rels_path(part_path)))
+    for relation in root.iterfind("rel:Relationship", ns):
+        target = relation.get("Target")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(part_path), target))
+        relations[relation.get("Id")] = (relation.get("Type"), target)
+    return relations
+
+def get_relations(archive, part_path, rel_type):
+    return [target for target_type, target in read_relations(archive, part_path).values() if target_type == rel_type]
+
+def find_first_chart(archive, drawing_path):
+    relations = read_relations(archive, drawing_path)
+    drawing = ET.fromstring(archive.read(drawing_path))
+    # Same anchor order as openpyxl's SpreadsheetDrawing
+    for anchor_type in ["twoCellAnchor", "oneCellAnchor", "absoluteAnchor"]:
+        for anchor in drawing.iterfind(f"xdr:{anchor_type}", ns):
+            chart = anchor.find(".//c:chart", ns)
+            if chart is None: continue
+            rel_type, target = relations[chart.get(f"{{{ns['r']}}}id")]
+            if rel_type == chart_rel_type:
+                return target
+    raise KeyError("No chart")
+
+def parse_chart(chart_data):
+    plot_area = ET.fromstring(chart_data).find("c:chart/c:plotArea", ns)
+    chart = next(child for child in plot_area if child.tag.split("}")[-1] in chart_tags)
+
+    series = list()
+    for serie in chart.iterfind("c:ser", ns):
+        title = serie.find("c:tx/c:v", ns)
+        if serie.find("c:tx", ns) is None:
+            title = None
+        else:
+            title = title.text if title is not None else ""
+        x_range = serie.find("c:xVal/c:numRef/c:f", ns).text
+        y_range = serie.find("c:yVal/c:numRef/c:f", ns).text
+        series.append((title, x_range, y_range))
+    return series
+
+def parse_range(a1_range):
+    result = re.findall(range_regex, a1_range)[0]
+    min_col, max_col = column_index(result[0]), column_index(result[2])
+    min_row, max_row = int(result[1]), int(result[3])
+    return min(min_col, max_col), min(min_row, max_row), max(min_col, max_col), max(min_row, max_row)
+
+def column_index(column):
+    index = 0
+    for letter in column:
+        index = index*26 + ord(letter) - ord("A") + 1
+    return index
+
+def block_to_array(block):
+    # Column by column, the order in which the chart reads a multi-column range
+    return np.array(block, dtype=float).ravel(order="F")
+
+def read_ranges(sheet_file, ranges):
+    bounds = {a1_range: parse_range(a1_range) for a1_range in set(ranges)}
+    blocks = {a1_range: np.full((max_row-min_row+1, max_col-min_col+1), np.nan) for a1_range, (min_col, min_row, max_col, max_row) in bounds.items()}
+    min_wanted_row = min(bound[1] for bound in bounds.values())
+    max_wanted_row = max(bound[3] for bound in bounds.values())
+    
+    row_tag, cell_tag, value_tag = f"{{{ns['main']}}}row", f"{{{ns['main']}}}c", f"{{{ns['main']}}}v"
+    row, col = 0, 0
+    for event, element in ET.iterparse(sheet_file, events=("start", "end")):
+        if event == "start":
+            # The r attribute is optional on rows and cells, which then follow the previous one
+            if element.tag == row_tag:
+                row, col = int(element.get("r", row + 1)), 0
+            continue
+        if element.tag != cell_tag: continue
+        reference = element.get("r")
+        if reference is None:
+            col += 1
+        else:
+            column, row = cell_regex.match(reference).groups()
+            row, col = int(row), column_index(column)
+        if row > max_wanted_row:
+            break
+        if row >= min_wanted_row:
+            for a1_range, (min_col, min_row, max_col, max_row) in bounds.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    blocks[a1_range][row-min_row, col-min_col] = cell_value(element.get("t"), element.findtext(value_tag))
+        element.clear()
+
+    return {a1_range: block.ravel(order="F") for a1_range, block in blocks.items()}
+
+def cell_value(cell_type, value):
+    if value is None or cell_type not in (None, "n", "b"):
+        return np.nan
+    return float(value)
+
+def read_chart_series_openpyxl(path):
+    import openpyxl
+    book = openpyxl.load_workbook(path, data_only=True)
+    try:
+        sheet = book["Stabilito"]
+    except KeyError:
+        sheet = book["stabilito"]
+
+    series = list()
+    for serie in sheet._charts[0].series:
+        title = None if serie.title is None else serie.title.value or ""
+        x_values = read_range_openpyxl(sheet, serie.xVal.numRef.f)
+        y_values = read_range_openpyxl(sheet, serie.yVal.numRef.f)
+        series.append((title, x_values, y_values))
+    return series
+
+def read_range_openpyxl(sheet, a1_range):
+    min_col, min_row, max_col, max_row = parse_range(a1_range)
+    return block_to_array(list(sheet.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col, values_only=True)))
+
+# BIFF8 records of the chart substreams, which xlrd skips
+record_bof, record_eof, record_continue = 0x0809, 0x000A, 0x003C
+record_series, record_ai, record_seriestext = 0x1003, 0x1051, 0x100D
+bof_chart = 0x0020
+ptg_area3d, ptg_ref3d = (0x3B, 0x5B, 0x7B), (0x3A, 0x5A, 0x7A)
+# AI record ids, a scatter chart takes its x values from the categories
+ai_title, ai_values, ai_categories = 0, 1, 2
+ai_text, ai_reference = 1, 2
+
+def read_chart_series_xls(path):
+    import xlrd
+    with xlrd.open_workbook(path, on_demand=True) as book:
+        sheet_index = next(book.sheet_names().index(name) for name in sheet_names if name in book.sheet_names())
+        series = parse_xls_chart(book.mem, book._sh_abs_posn[sheet_index])
+
+        sheets = dict()
+        output = list()
+        for title, x_range, y_range in series:
+            values = list()
+            for ixti, min_row, max_row, min_col, max_col in (x_range, y_range):
+                # The ranges may point to another sheet through the EXTERNSHEET table
+                try:
+                    range_sheet = book._all_sheets_map[book._externsheet_info[ixti][1]]
+                except IndexError:
+                    range_sheet = -1
+                if range_sheet < 0:
+                    range_sheet = sheet_index
+                if range_sheet not in sheets:
+                    sheets[range_sheet] = book.sheet_by_index(range_sheet)
+                values.append(read_range_xlrd(sheets[range_sheet], min_row, max_row, min_col, max_col))
+            output.append((title, *values))
+    return output
+
+def read_records(data, position):
+    # Records longer than 8224 bytes go on in CONTINUE records, joined to the record they extend
+    code, record = None, b""
+    while position + 4 <= len(data):
+        next_code, length = struct.unpack_from("<HH", data, position)
+        next_record = data[position+4:position+4+length]
+        position += 4 + length
+        if next_code == record_continue and code is not None:
+            record += next_record
+            continue
+        if code is not None:
+            yield code, record
+        code, record = next_code, next_record
+    if code is not None:
+        yield code, record
+
+def parse_xls_chart(data, sheet_position):
+    # The first chart embedded in the worksheet substream, as (title, x range, y range) with 0-based ranges
+    depth = 0
+    records = read_records(data, sheet_position)
+    for code, record in records:
+        if code == record_bof:
+            depth += 1
+            if depth == 2 and struct.unpack_from("<H", record, 2)[0] == bof_chart:
+                return parse_chart_records(records)
+        elif code == record_eof:
+            depth -= 1
+            if depth == 0: break
+    raise KeyError("No chart")
+
+def parse_chart_records(records):
+    series = list()
+    links = None
+    for code, record in records:
+        if code == record_eof:
+            break
+        elif code == record_series:
+            links = dict()
+            series.append(links)
+        elif code == record_ai and links is not None and record[0] not in links:
+            link_id, link_type, formula_size = record[0], record[1], struct.unpack_from("<H", record, 6)[0]
+            links[link_id] = link_type, parse_area(record[8:8+formula_size])
+        elif code == record_seriestext and links is not None and set(links) == {ai_title}:
+            links["text"] = read_short_unicode(record, 2)
+        elif code == record_bof:
+            raise ValueError("Unexpected substream in chart")
+
+    output = list()
+    for links in series:
+        title_type = links.get(ai_title, (0, None))[0]
+        if title_type == ai_text:
+            title = links.get("text", "")
+        elif title_type == ai_reference:
+            title = ""
+        else:
+            title = None
+        x_range, y_range = links.get(ai_categories, (0, None))[1], links.get(ai_values, (0, None))[1]
+        if x_range is None or y_range is None:
+            raise ValueError("Serie without cell references")
+        output.append((title, x_range, y_range))
+    return output
+
+def parse_area(formula):
+    if len(formula) >= 11 and formula[0] in ptg_area3d:
+        ixti, min_row, max_row, min_col, max_col = struct.unpack_from("<HHHHH", formula, 1)
+        return ixti, min_row, max_row, min_col & 0x3FFF, max_col & 0x3FFF
+    if len(formula) >= 7 and formula[0] in ptg_ref3d:
+        ixti, row, col = struct.unpack_from("<HHH", formula, 1)
+        return ixti, row, row, col & 0x3FFF, col & 0x3FFF
+    return None
+
+def read_short_unicode(record, position):
+    length, flags = record[position], record[position+1]
+    text = record[position+2:]
+    return text[:2*length].decode("utf-16-le") if flags & 1 else text[:length].decode("latin-1")
+
+def read_range_xlrd(sheet, min_row, max_row, min_col, max_col):
+    import xlrd
+    block = np.full((max_row-min_row+1, max_col-min_col+1), np.nan)
+    for row in range(min_row, min(max_row+1, sheet.nrows)):
+        for col in range(min_col, min(max_col+1, sheet.row_len(row))):
+            cell = sheet.cell(row, col)
+            if cell.ctype in (xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_DATE, xlrd.XL_CELL_BOOLEAN):
+                block[row-min_row, col-min_col] = cell.value
+    return block.ravel(order="F")